@@ -0,0 +1,5 @@
+"""
+权限检查性能测试
+
+在src目录下执行：python -m benchmarks --help
+"""
@@ -0,0 +1,52 @@
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+from .permission_check import TOKEN_STORAGES
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="对各种限流token存储方式分别运行 benchmarks.permission_check",
+    )
+    parser.add_argument(
+        "--token-storage",
+        action="append",
+        choices=TOKEN_STORAGES,
+        help="要测试的限流token存储方式，可指定多次（默认：全部）",
+    )
+    args, rest = parser.parse_known_args()
+
+    results = []
+    for storage in args.token_storage or TOKEN_STORAGES:
+        proc = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.permission_check",
+                "--token-storage",
+                storage,
+                *rest,
+            ],
+            cwd=Path(__file__).parent.parent,
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+        results.append(json.loads(proc.stdout.decode().strip().splitlines()[-1]))
+
+    print(
+        f"{'token storage':<16}{'permission storage':<20}"
+        f"{'p50 (ms)':>10}{'p99 (ms)':>10}{'msg/s':>10}"
+    )
+    for r in results:
+        print(
+            f"{r['token_storage']:<16}{r['permission_storage']:<20}"
+            f"{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['throughput']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+在单一配置下构造服务树、写入权限与限流规则，然后对service.check进行压测
+
+由于插件在导入时读取配置，每种限流token存储方式需要在独立的进程中运行，
+请通过 python -m benchmarks 运行
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import timedelta
+
+TOKEN_STORAGES = ["inmemory", "datastore", "gcra", "hybrid"]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.permission_check")
+    parser.add_argument(
+        "--token-storage",
+        choices=TOKEN_STORAGES,
+        default="inmemory",
+    )
+    parser.add_argument(
+        "--permission-storage", choices=["datastore", "inmemory"], default="datastore"
+    )
+    parser.add_argument("--depth", type=int, default=3, help="子服务树的深度")
+    parser.add_argument("--width", type=int, default=4, help="每个服务的子服务数量")
+    parser.add_argument("--permissions", type=int, default=1000, help="权限配置数量")
+    parser.add_argument("--rules", type=int, default=100, help="限流规则数量")
+    parser.add_argument("--users", type=int, default=1000, help="发送消息的用户数量")
+    parser.add_argument("--groups", type=int, default=50, help="群组数量")
+    parser.add_argument("--events", type=int, default=5000, help="压测的事件数量")
+    parser.add_argument("--warmup", type=int, default=500, help="预热的事件数量")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def init_nonebot(args: argparse.Namespace, db_path: Path):
+    import nonebot
+    from nonebot.adapters.onebot.v11 import Adapter
+
+    nonebot.init(
+        driver="~none",
+        log_level="WARNING",
+        sqlalchemy_database_url=f"sqlite+aiosqlite:///{db_path}",
+        alembic_startup_check=False,
+        access_control_rate_limit_token_storage=args.token_storage,
+        access_control_permission_storage=args.permission_storage,
+        access_control_reply_on_permission_denied_enabled=False,
+        access_control_reply_on_rate_limited_enabled=False,
+    )
+    nonebot.get_driver().register_adapter(Adapter)
+    nonebot.require("nonebot_plugin_access_control")
+
+
+def build_service_tree(depth: int, width: int):
+    from nonebot_plugin_access_control_api.service import create_plugin_service
+
+    root = create_plugin_service("ac_benchmark")
+    nodes = [root]
+    layer = [root]
+    for _ in range(depth):
+        next_layer = []
+        for node in layer:
+            for i in range(width):
+                next_layer.append(node.create_subservice(f"s{i}"))
+        nodes.extend(next_layer)
+        layer = next_layer
+
+    # layer为叶子服务，nodes包含所有服务
+    return nodes, layer
+
+
+def random_subject(rnd: random.Random, args: argparse.Namespace) -> str:
+    user_id = 10000 + rnd.randrange(args.users)
+    group_id = 20000 + rnd.randrange(args.groups)
+    return rnd.choice(
+        [
+            f"qq:g{group_id}:{user_id}",
+            f"qq:{user_id}",
+            f"qq:g{group_id}",
+            "qq:group",
+            "qq",
+            "all",
+        ]
+    )
+
+
+async def seed(args: argparse.Namespace, rnd: random.Random, nodes):
+    from nonebot_plugin_access_control_api.context import context
+
+    from nonebot_plugin_access_control.repository.utils import use_ac_session
+    from nonebot_plugin_access_control.repository.rate_limit import IRateLimitRepository
+    from nonebot_plugin_access_control.repository.permission import (
+        IPermissionRepository,
+    )
+
+    permission_repo = context.require(IPermissionRepository)
+    rate_limit_repo = context.require(IRateLimitRepository)
+
+    async with use_ac_session():
+        for _ in range(args.permissions):
+            # 大多数为允许，避免压测时几乎所有请求都被拒绝
+            await permission_repo.set_permission(
+                rnd.choice(nodes), random_subject(rnd, args), rnd.random() < 0.9
+            )
+
+        for _ in range(args.rules):
+            await rate_limit_repo.add_rate_limit_rule(
+                rnd.choice(nodes),
+                random_subject(rnd, args),
+                timedelta(hours=1),
+                10**9,
+            )
+
+
+async def run(args: argparse.Namespace) -> dict:
+    from nonebot import get_adapter
+    from nonebot_plugin_orm import init_orm
+    from nonebot.adapters.onebot.v11 import Bot, Adapter
+
+    from nonebot_plugin_access_control.repository.utils import use_ac_session
+    from tests.utils.ob11_event import SELF_ID, fake_ob11_group_message_event
+
+    rnd = random.Random(args.seed)
+
+    await init_orm()
+
+    nodes, leaves = build_service_tree(args.depth, args.width)
+    await seed(args, rnd, nodes)
+
+    bot = Bot(get_adapter(Adapter), str(SELF_ID))
+
+    async def fire() -> float:
+        service = rnd.choice(leaves)
+        event = fake_ob11_group_message_event(
+            "/benchmark",
+            user_id=10000 + rnd.randrange(args.users),
+            group_id=20000 + rnd.randrange(args.groups),
+        )
+
+        # 只测量service.check本身，不包含patcher中run_preprocessor额外的
+        # 事件缓存、主体提取缓存与鉴权结果缓存
+        start = time.perf_counter()
+        async with use_ac_session():
+            await service.check(bot, event)
+        return time.perf_counter() - start
+
+    for _ in range(args.warmup):
+        await fire()
+
+    start = time.perf_counter()
+    latencies = [await fire() for _ in range(args.events)]
+    elapsed = time.perf_counter() - start
+
+    if args.token_storage == "hybrid":
+        # 将剩余的token写入数据库并停止后台写入任务
+        from nonebot_plugin_access_control_api.context import context
+
+        from nonebot_plugin_access_control.repository.rate_limit_token import (
+            IRateLimitTokenRepository,
+        )
+
+        await context.require(IRateLimitTokenRepository).close()
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)]
+    return {
+        "token_storage": args.token_storage,
+        "permission_storage": args.permission_storage,
+        "events": args.events,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": p99 * 1000,
+        "throughput": args.events / elapsed,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        init_nonebot(args, Path(tmp) / "benchmark.sqlite3")
+        result = asyncio.run(run(args))
+
+    json.dump(result, sys.stdout)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from typing import TYPE_CHECKING
 
-from arclet.alconna import Args, Option, Alconna, Subcommand, store_true
+from arclet.alconna import Args, Option, Alconna, AllParam, Subcommand, store_true
 
 if TYPE_CHECKING:
     from .handler.utils.env import T_ENV
@@ -28,7 +28,11 @@ alc_ac = Alconna(
             "ls",
             Option("--srv|--service", Args["service;?", str]),
             Option("--sbj|--subject", Args["subject;?", str]),
+            Option("--page", Args["page", int]),
+            Option("--page-size", Args["page_size", int]),
         ),
+        Subcommand("import", Args["content;?", AllParam]),
+        Subcommand("export"),
     ),
     Subcommand(
         "limit",
@@ -39,12 +43,16 @@ alc_ac = Alconna(
             Option("--lim|--limit", Args["limit", int]),
             Option("--span", Args["span", str]),
             Option("--overwrite", action=store_true, default=False),
+            Option("--bucket", action=store_true, default=False),
+            Option("--capacity", Args["capacity", int]),
         ),
         Subcommand("rm", Args["limit_rule_id", str]),
         Subcommand(
             "ls",
             Option("--srv|--service", Args["service;?", str]),
             Option("--sbj|--subject", Args["subject;?", str]),
+            Option("--page", Args["page", int]),
+            Option("--page-size", Args["page_size", int]),
         ),
         Subcommand(
             "reset",
@@ -58,6 +66,11 @@ alc_ac = Alconna(
         ),
     ),
     Subcommand("subject"),
+    Subcommand(
+        "stats",
+        Option("--srv|--service", Args["service;?", str]),
+        Subcommand("reset"),
+    ),
     Subcommand("help"),
 )
 
@@ -85,8 +98,11 @@ def help_ac(env: "T_ENV" = "nonebot") -> str:
     - `{cmd_start}permission ls --sbj <主体>`：列出主体已配置的服务权限
     - `{cmd_start}permission ls --srv <服务>`：列出服务已配置的主体权限
     - `{cmd_start}permission ls --sbj <主体> --srv <服务>`：列出主体与服务已配置的权限
+    - `{cmd_start}permission import <权限配置>`：批量导入权限配置，每行一条，格式为`allow|deny <服务> <主体>`
+    - `{cmd_start}permission export`：以上述格式导出所有已配置的权限
 - 流量限制
     - `{cmd_start}limit add --sbj <主体> --srv <服务> --limit <次数> --span <时间间隔> [--overwrite]`：为主体与服务添加限流规则
+    - `{cmd_start}limit add --sbj <主体> --srv <服务> --limit <次数> --span <时间间隔> --bucket [--capacity <容量>]`：为主体与服务添加令牌桶限流规则
     - `{cmd_start}limit rm <规则ID>`：删除限流规则
     - `{cmd_start}limit ls`：列出所有已配置的限流规则
     - `{cmd_start}limit ls --sbj <主体>`：列出主体已配置的限流规则
@@ -98,6 +114,12 @@ def help_ac(env: "T_ENV" = "nonebot") -> str:
     - `{cmd_start}service ls --srv <服务>`：列出服务的子服务层级
 - 主体测试
     - `{cmd_start}subject`：列出消息发送者的所有主体
+- 耗时统计（需设置`ACCESS_CONTROL_STATS_ENABLED=true`）
+    - `{cmd_start}stats`：列出所有服务鉴权各阶段的耗时统计
+    - `{cmd_start}stats --srv <服务>`：列出服务鉴权各阶段的耗时统计
+    - `{cmd_start}stats reset`：清空耗时统计
+
+列出权限与限流规则时，每页默认显示20条，可通过`--page <页码>`与`--page-size <每页数量>`翻页
 
 其中`<服务>`的格式如下：
 
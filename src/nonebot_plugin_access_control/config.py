@@ -8,8 +8,23 @@ class Config(BaseSettings):
     access_control_default_permission: Literal["allow", "deny"] = "allow"
 
     access_control_rate_limit_token_storage: Literal[
-        "datastore", "inmemory"
+        "datastore", "inmemory", "gcra", "hybrid"
     ] = "inmemory"
+    access_control_rate_limit_token_purge_batch_size: int = 1000
+    access_control_rate_limit_token_purge_batch_interval: float = 0.1  # 单位：秒
+    access_control_rate_limit_token_flush_interval: float = 0.5  # 单位：秒
+    access_control_rate_limit_token_flush_batch_size: int = 1000
+    access_control_rate_limit_token_snapshot_enabled: bool = False
+    access_control_rate_limit_token_snapshot_interval: float = 60  # 单位：秒
+
+    access_control_rate_limit_rule_cache_ttl: float = 0  # 单位：秒
+
+    access_control_permission_storage: Literal["datastore", "inmemory"] = "datastore"
+    access_control_permission_cache_size: int = 0
+    access_control_permission_cache_ttl: float = 60  # 单位：秒
+    access_control_subject_cache_size: int = 4096
+
+    access_control_stats_enabled: bool = False
 
     access_control_auto_patch_enabled: bool = False
     access_control_auto_patch_ignore: list[str] = Field(default_factory=list)
@@ -15,6 +15,7 @@ from ..config import conf
 from . import (
     help_handler,
     limit_handler,
+    stats_handler,
     service_handler,
     subject_handler,
     permission_handler,
@@ -52,6 +53,8 @@ async def handle_ac(fout: TextIO, cmd: str):
                 await _handle_service(fout, result)
             elif result.find("subject"):
                 await _handle_subject(fout, result)
+            elif result.find("stats"):
+                await _handle_stats(fout, result)
             elif result.find("help"):
                 await _handle_help(fout, result)
             else:
@@ -65,12 +68,16 @@ async def _handle_permission(fout: TextIO, result: Arparma[DataCollection]):
     allow = result.query("permission.allow")
     deny = result.query("permission.deny")
     rm = result.query("permission.rm")
+    import_ = result.query("permission.import")
+    export = result.query("permission.export")
 
     if ls:
         await permission_handler.ls(
             fout,
             result.all_matched_args.get("service"),
             result.all_matched_args.get("subject"),
+            result.all_matched_args.get("page"),
+            result.all_matched_args.get("page_size"),
         )
     elif allow:
         await permission_handler.set_(
@@ -92,6 +99,13 @@ async def _handle_permission(fout: TextIO, result: Arparma[DataCollection]):
             result.all_matched_args.get("service"),
             result.all_matched_args.get("subject"),
         )
+    elif import_:
+        await permission_handler.import_(
+            fout,
+            result.all_matched_args.get("content"),
+        )
+    elif export:
+        await permission_handler.export(fout)
     else:
         raise AccessControlBadRequestError("命令格式错误")
 
@@ -110,6 +124,8 @@ async def _handle_limit(fout: TextIO, result: Arparma[DataCollection]):
             result.all_matched_args.get("limit"),
             result.all_matched_args.get("span"),
             result.query("limit.add.overwrite", False).value,
+            result.query("limit.add.bucket", False).value,
+            result.all_matched_args.get("capacity"),
         )
     elif rm:
         await limit_handler.rm(
@@ -121,6 +137,8 @@ async def _handle_limit(fout: TextIO, result: Arparma[DataCollection]):
             fout,
             result.all_matched_args.get("service"),
             result.all_matched_args.get("subject"),
+            result.all_matched_args.get("page"),
+            result.all_matched_args.get("page_size"),
         )
     elif reset:
         await limit_handler.reset(
@@ -146,6 +164,18 @@ async def _handle_subject(fout: TextIO, result: Arparma[DataCollection]):
     await subject_handler.subject(fout)
 
 
+async def _handle_stats(fout: TextIO, result: Arparma[DataCollection]):
+    reset = result.query("stats.reset")
+
+    if reset:
+        await stats_handler.reset(fout)
+    else:
+        await stats_handler.ls(
+            fout,
+            result.all_matched_args.get("service"),
+        )
+
+
 async def _handle_help(fout: TextIO, result: Arparma[DataCollection]):
     await help_handler.help(fout)
 
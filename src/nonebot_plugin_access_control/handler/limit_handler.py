@@ -1,27 +1,42 @@
 from typing import TextIO, Optional
 
 import pytimeparser
+from nonebot_plugin_access_control_api.context import context
 from nonebot_plugin_access_control_api.service import Service
 from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
 from nonebot_plugin_access_control_api.service.methods import (
     get_service_by_qualified_name,
 )
+from nonebot_plugin_access_control_api.service.interface.factory import (
+    IServiceComponentFactory,
+)
 from nonebot_plugin_access_control_api.errors import (
     AccessControlQueryError,
     AccessControlBadRequestError,
 )
 
 from ..repository.utils import use_ac_session
+from .utils.page import get_page, write_page, async_slice
 from .utils.permission import require_superuser_or_script
+from ..repository.rate_limit import TokenBucketRateLimitRule
 
 
 def _map_rule(f: TextIO, rule: RateLimitRule, service_name: Optional[str]):
-    f.write(
-        f"[{rule.id}] 服务 '{rule.service.qualified_name}' "
-        f"限制主体 '{rule.subject}' "
-        f"每 {int(rule.time_span.total_seconds())} 秒钟"
-        f"最多调用 {rule.limit} 次 "
-    )
+    if isinstance(rule, TokenBucketRateLimitRule):
+        f.write(
+            f"[{rule.id}] 服务 '{rule.service.qualified_name}' "
+            f"限制主体 '{rule.subject}' "
+            f"令牌桶容量 {rule.capacity} 次，"
+            f"每 {int(rule.time_span.total_seconds())} 秒钟"
+            f"补充 {rule.limit} 次 "
+        )
+    else:
+        f.write(
+            f"[{rule.id}] 服务 '{rule.service.qualified_name}' "
+            f"限制主体 '{rule.subject}' "
+            f"每 {int(rule.time_span.total_seconds())} 秒钟"
+            f"最多调用 {rule.limit} 次 "
+        )
     if rule.overwrite:
         f.write(" (覆写)")
     if service_name is not None and rule.service.qualified_name != service_name:
@@ -36,6 +51,8 @@ async def add(
     limit: Optional[int],
     time_span: Optional[str],
     overwrite: Optional[bool],
+    bucket: Optional[bool] = None,
+    capacity: Optional[int] = None,
 ):
     if not subject or not service_name:
         raise AccessControlBadRequestError("请指定服务名（--service）与主体（--subject）")
@@ -45,6 +62,10 @@ async def add(
         raise AccessControlBadRequestError("请指定限制次数（--limit）")
     elif limit <= 0:
         raise AccessControlBadRequestError("限制次数（--limit）必须大于0")
+    elif capacity is not None and not bucket:
+        raise AccessControlBadRequestError("仅令牌桶规则（--bucket）可以指定容量（--capacity）")
+    elif capacity is not None and capacity <= 0:
+        raise AccessControlBadRequestError("令牌桶容量（--capacity）必须大于0")
 
     try:
         parsed_time_span = pytimeparser.parse(time_span)
@@ -56,9 +77,23 @@ async def add(
         if service is None:
             raise AccessControlQueryError(f"找不到服务 {service_name}")
 
-        rule = await service.add_rate_limit_rule(
-            subject, parsed_time_span, limit, overwrite or False
-        )
+        if bucket:
+            # Service未暴露kind参数，直接调用实现
+            impl = context.require(IServiceComponentFactory).create_rate_limit_impl(
+                service
+            )
+            rule = await impl.add_rate_limit_rule(
+                subject,
+                parsed_time_span,
+                limit,
+                overwrite or False,
+                kind="bucket",
+                capacity=capacity or limit,
+            )
+        else:
+            rule = await service.add_rate_limit_rule(
+                subject, parsed_time_span, limit, overwrite or False
+            )
     _map_rule(f, rule, service_name)
 
 
@@ -79,14 +114,26 @@ async def rm(
 
 
 @require_superuser_or_script
-async def ls(f: TextIO, service_name: Optional[str], subject: Optional[str]):
+async def ls(
+    f: TextIO,
+    service_name: Optional[str],
+    subject: Optional[str],
+    page: Optional[int] = None,
+    page_size: Optional[int] = None,
+):
+    page, page_size = get_page(page, page_size)
+    offset = (page - 1) * page_size
+
+    def write_item(f: TextIO, rule: RateLimitRule):
+        _map_rule(f, rule, service_name)
+
     async with use_ac_session():
-        if not service_name and not subject:
-            rules = [x async for x in Service.get_all_rate_limit_rules()]
-        elif not service_name:
-            rules = [
-                x async for x in Service.get_all_rate_limit_rules_by_subject(subject)
-            ]
+        if not service_name:
+            # 由数据库完成排序与分页
+            impl = context.require(IServiceComponentFactory).typeof_rate_limit_impl()
+            rules = impl.get_rate_limit_rules_page(
+                subject or None, offset, page_size + 1
+            )
         else:
             service = get_service_by_qualified_name(
                 service_name, raise_on_not_exists=True
@@ -99,15 +146,23 @@ async def ls(f: TextIO, service_name: Optional[str], subject: Optional[str]):
                     x async for x in service.get_rate_limit_rules_by_subject(subject)
                 ]
 
-    if len(rules) != 0:
-        # 按照服务全称、subject排序
-        rules = sorted(rules, key=lambda x: (x.service.qualified_name, x.subject, x.id))
+            # 按照服务全称、subject排序
+            rules = async_slice(
+                sorted(
+                    rules, key=lambda x: (x.service.qualified_name, x.subject, x.id)
+                ),
+                offset,
+                page_size + 1,
+            )
 
-        for rule in rules:
-            _map_rule(f, rule, service_name)
-            f.write("\n")
-    else:
-        f.write("无")
+        await write_page(
+            f,
+            rules,
+            page,
+            page_size,
+            write_item,
+            [("--srv", service_name), ("--sbj", subject)],
+        )
 
 
 @require_superuser_or_script
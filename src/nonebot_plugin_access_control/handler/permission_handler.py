@@ -1,9 +1,11 @@
 from typing import TextIO, Optional
+from collections.abc import Sequence
 
+from nonebot_plugin_access_control_api.context import context
 from nonebot_plugin_access_control_api.models.permission import Permission
-from nonebot_plugin_access_control_api.service import (
-    Service,
-    get_service_by_qualified_name,
+from nonebot_plugin_access_control_api.service import get_service_by_qualified_name
+from nonebot_plugin_access_control_api.service.interface.factory import (
+    IServiceComponentFactory,
 )
 from nonebot_plugin_access_control_api.errors import (
     AccessControlQueryError,
@@ -11,8 +13,12 @@ from nonebot_plugin_access_control_api.errors import (
 )
 
 from ..repository.utils import use_ac_session
+from .utils.page import get_page, write_page, async_slice
 from .utils.permission import require_superuser_or_script
 
+# 导出权限时每次查询的条数
+EXPORT_PAGE_SIZE = 500
+
 
 def _map_permission(p: Permission, query_service_name: Optional[str] = None) -> str:
     s = f"'{p.service.qualified_name}'"
@@ -61,31 +67,110 @@ async def rm(f: TextIO, service_name: Optional[str], subject: Optional[str]):
 
 
 @require_superuser_or_script
-async def ls(f: TextIO, service_name: Optional[str], subject: Optional[str]):
+async def ls(
+    f: TextIO,
+    service_name: Optional[str],
+    subject: Optional[str],
+    page: Optional[int] = None,
+    page_size: Optional[int] = None,
+):
+    page, page_size = get_page(page, page_size)
+    offset = (page - 1) * page_size
+
+    def write_item(f: TextIO, p: Permission):
+        f.write(_map_permission(p, service_name))
+
     async with use_ac_session():
-        if not service_name and not subject:
-            permissions = [x async for x in Service.get_all_permissions()]
-        elif not service_name:
-            permissions = [
-                x async for x in Service.get_all_permissions_by_subject(subject)
-            ]
+        if not service_name:
+            # 由数据库完成排序与分页
+            impl = context.require(IServiceComponentFactory).typeof_permission_impl()
+            permissions = impl.get_permissions_page(
+                subject or None, offset, page_size + 1
+            )
         else:
             service = get_service_by_qualified_name(
                 service_name, raise_on_not_exists=True
             )
             if not subject:
-                permissions = [x async for x in service.get_permissions()]
+                # 按照服务全称、先deny再allow、subject排序
+                permissions = async_slice(
+                    sorted(
+                        [x async for x in service.get_permissions()],
+                        key=lambda x: (x.service.qualified_name, x.allow, x.subject),
+                    ),
+                    offset,
+                    page_size + 1,
+                )
             else:
-                permissions = [await service.get_permission_by_subject(subject)]
-
-    if len(permissions) != 0:
-        # 按照服务全称、先allow再deny、subject排序
-        permissions = sorted(
-            permissions, key=lambda x: (x.service.qualified_name, x.allow, x.subject)
+                p = await service.get_permission_by_subject(subject)
+                permissions = async_slice(
+                    [p] if p is not None else [], offset, page_size + 1
+                )
+
+        await write_page(
+            f,
+            permissions,
+            page,
+            page_size,
+            write_item,
+            [("--srv", service_name), ("--sbj", subject)],
         )
 
-        for p in permissions:
-            f.write(_map_permission(p, service_name))
-            f.write("\n")
-    else:
+
+def _parse_permissions(content: str) -> list[Permission]:
+    # 每条权限配置为 allow|deny <服务> <主体>，服务与主体均不含空白字符
+    words = content.split()
+    if len(words) % 3 != 0:
+        raise AccessControlBadRequestError("权限配置格式错误，每行应为 allow|deny <服务> <主体>")
+
+    permissions = []
+    for i in range(0, len(words), 3):
+        action, service_name, subject = words[i : i + 3]
+        if action not in ("allow", "deny"):
+            raise AccessControlBadRequestError(
+                f"第{i // 3 + 1}条权限配置格式错误：{action} {service_name} {subject}"
+            )
+
+        service = get_service_by_qualified_name(service_name)
+        if service is None:
+            raise AccessControlQueryError(f"找不到服务 {service_name}")
+
+        permissions.append(Permission(service, subject, action == "allow"))
+    return permissions
+
+
+@require_superuser_or_script
+async def import_(f: TextIO, content: Optional[Sequence[str]]):
+    if not content:
+        raise AccessControlBadRequestError("请指定要导入的权限配置")
+
+    permissions = _parse_permissions(" ".join(content))
+
+    factory = context.require(IServiceComponentFactory)
+    async with use_ac_session():
+        changed = await factory.typeof_permission_impl().set_permissions(permissions)
+    f.write(f"导入成功，共{len(permissions)}条，其中{len(changed)}条发生变更")
+
+
+@require_superuser_or_script
+async def export(f: TextIO):
+    impl = context.require(IServiceComponentFactory).typeof_permission_impl()
+
+    # 按页查询，每页单独查询数据库，避免一次性加载全部权限
+    cnt = 0
+    while True:
+        page_cnt = 0
+        async with use_ac_session():
+            async for p in impl.get_permissions_page(None, cnt, EXPORT_PAGE_SIZE):
+                f.write(
+                    f"{'allow' if p.allow else 'deny'} "
+                    f"{p.service.qualified_name} {p.subject}\n"
+                )
+                page_cnt += 1
+
+        cnt += page_cnt
+        if page_cnt < EXPORT_PAGE_SIZE:
+            break
+
+    if cnt == 0:
         f.write("无")
@@ -0,0 +1,63 @@
+from typing import TextIO, Optional
+
+from nonebot_plugin_access_control_api.service.methods import (
+    get_service_by_qualified_name,
+)
+
+from ..utils.histogram import LatencyHistogram
+from .utils.permission import require_superuser_or_script
+from ..stats import (
+    STAGES,
+    stats_enabled,
+    get_latency_histograms,
+    reset_latency_histograms,
+)
+
+
+def _format_ms(seconds: Optional[float]) -> str:
+    return f"{seconds * 1000:.3f}ms"
+
+
+def _map_histogram(f: TextIO, stage: str, hist: LatencyHistogram):
+    f.write(
+        f"{STAGES[stage]}：{hist.count} 次，"
+        f"平均 {_format_ms(hist.mean)}，"
+        f"p50 {_format_ms(hist.percentile(0.5))}，"
+        f"p99 {_format_ms(hist.percentile(0.99))}，"
+        f"最大 {_format_ms(hist.max / 1_000_000)}"
+    )
+
+
+@require_superuser_or_script
+async def ls(f: TextIO, service_name: Optional[str]):
+    if not stats_enabled():
+        f.write("未启用耗时统计（请设置ACCESS_CONTROL_STATS_ENABLED=true）")
+        return
+
+    if service_name:
+        # 检查服务是否存在
+        get_service_by_qualified_name(service_name, raise_on_not_exists=True)
+
+    histograms = get_latency_histograms()
+    services = sorted(
+        {srv for srv, _ in histograms if not service_name or srv == service_name}
+    )
+
+    if len(services) == 0:
+        f.write("无")
+        return
+
+    for srv in services:
+        f.write(f"服务 '{srv}'\n")
+        for stage in STAGES:
+            hist = histograms.get((srv, stage))
+            if hist is not None:
+                f.write("    ")
+                _map_histogram(f, stage, hist)
+                f.write("\n")
+
+
+@require_superuser_or_script
+async def reset(f: TextIO):
+    reset_latency_histograms()
+    f.write("成功")
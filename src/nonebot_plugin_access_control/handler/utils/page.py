@@ -0,0 +1,55 @@
+from typing import TextIO, TypeVar, Callable, Optional
+from collections.abc import Iterable, Sequence, AsyncIterable
+
+from nonebot_plugin_access_control_api.errors import AccessControlBadRequestError
+
+T = TypeVar("T")
+
+DEFAULT_PAGE_SIZE = 20
+
+
+def get_page(page: Optional[int], page_size: Optional[int]) -> tuple[int, int]:
+    if page is None:
+        page = 1
+    if page_size is None:
+        page_size = DEFAULT_PAGE_SIZE
+
+    if page <= 0:
+        raise AccessControlBadRequestError("页码（--page）必须大于0")
+    if page_size <= 0:
+        raise AccessControlBadRequestError("每页数量（--page-size）必须大于0")
+
+    return page, page_size
+
+
+async def async_slice(items: Iterable[T], offset: int, limit: int) -> AsyncIterable[T]:
+    for x in list(items)[offset : offset + limit]:
+        yield x
+
+
+async def write_page(
+    f: TextIO,
+    items: AsyncIterable[T],
+    page: int,
+    page_size: int,
+    write_item: Callable[[TextIO, T], None],
+    options: Sequence[tuple[str, Optional[str]]] = (),
+):
+    # items最多应包含page_size + 1项，多出的一项用于判断是否还有下一页
+    # options为查询时指定的其他选项，用于提示查看下一页的完整参数
+    cnt = 0
+    async for x in items:
+        cnt += 1
+        if cnt <= page_size:
+            write_item(f, x)
+            f.write("\n")
+
+    if cnt == 0:
+        if page == 1:
+            f.write("无")
+        else:
+            f.write(f"第{page}页无内容")
+    elif cnt > page_size:
+        args = [f"{k} {v}" for k, v in options if v]
+        args.append(f"--page {page + 1} --page-size {page_size}")
+        f.write(f"（第{page}页，使用 {' '.join(args)} 查看下一页）")
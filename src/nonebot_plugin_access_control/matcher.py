@@ -1,4 +1,6 @@
-from io import StringIO
+from io import TextIOBase
+from typing import Optional
+from asyncio import Queue, create_task
 
 from nonebot import on_command
 from nonebot.internal.matcher import Matcher
@@ -9,22 +11,51 @@ from .handler import handle_ac
 cmd = on_command("ac")
 
 
-async def send_multipart(matcher: Matcher, content: str):
-    lines = content.split("\n")
+class MultipartSender(TextIOBase):
+    # 逐行写入，每凑满20行即由后台任务发送一条消息，不在内存中缓存全部输出
+    def __init__(self, matcher: Matcher, lines_per_message: int = 20):
+        self.matcher = matcher
+        self.lines_per_message = lines_per_message
+        self._partial = ""
+        self._lines: list[str] = []
+        self._queue: Queue[Optional[str]] = Queue()
+        self._sending = create_task(self._send_loop())
 
-    line_cnt = 0
-    msg = ""
-    for line in lines:
-        msg += line
-        msg += "\n"
-        line_cnt += 1
-        if line_cnt == 20:
-            await matcher.send(msg.strip())
-            line_cnt = 0
-            msg = ""
+    def writable(self) -> bool:
+        return True
 
-    if line_cnt != 0:
-        await matcher.send(msg.strip())
+    def write(self, s: str) -> int:
+        # 发送任务因异常退出后不再接收输出，抛出该异常，避免队列无限增长
+        if self._sending.done():
+            self._sending.result()
+            raise ValueError("write to closed sender")
+
+        *lines, self._partial = (self._partial + s).split("\n")
+        for line in lines:
+            self._lines.append(line)
+            if len(self._lines) == self.lines_per_message:
+                self._queue.put_nowait("\n".join(self._lines))
+                self._lines = []
+        return len(s)
+
+    async def _send_loop(self):
+        while True:
+            content = await self._queue.get()
+            if content is None:
+                break
+            content = content.strip()
+            if content:
+                await self.matcher.send(content)
+
+    async def aclose(self):
+        if self._partial:
+            self._lines.append(self._partial)
+            self._partial = ""
+        if len(self._lines) != 0:
+            self._queue.put_nowait("\n".join(self._lines))
+            self._lines = []
+        self._queue.put_nowait(None)
+        await self._sending
 
 
 @cmd.handle()
@@ -36,6 +67,8 @@ async def handle_cmd(
 
     cmd_body: str = cmd_body.extract_plain_text().strip()
 
-    with StringIO() as f:
+    f = MultipartSender(matcher)
+    try:
         await handle_ac(f, "ac " + cmd_body)
-        await send_multipart(matcher, f.getvalue())
+    finally:
+        await f.aclose()
@@ -0,0 +1,113 @@
+import time
+from collections.abc import Iterable
+from typing import Any, Callable, Optional
+
+from sqlalchemy import func, select
+
+from ..utils.lock import LazyLock
+from .utils import use_ac_session
+
+T_Membership = dict[str, dict[str, int]]
+
+
+class SubjectMembership:
+    """
+    记录每个服务有哪些主体存在数据行（服务全称 -> 主体 -> 行数），
+    不存在于其中的(服务, 主体)无需查询数据库
+
+    只能感知本进程内的写入，因此每隔ttl秒从数据库重新加载；ttl不大于0时不启用，
+    此时总是认为(服务, 主体)可能存在
+    """
+
+    def __init__(self, orm_class: Any, ttl: Callable[[], float]):
+        self.orm_class = orm_class
+        self.ttl = ttl
+        self.data: Optional[T_Membership] = None
+        self._loaded_at = 0.0
+        self._version = 0
+        self._load_lock = LazyLock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl() > 0
+
+    def _is_fresh(self) -> bool:
+        return self.data is not None and time.monotonic() - self._loaded_at < self.ttl()
+
+    async def load(self) -> T_Membership:
+        async with self._load_lock:
+            if not self._is_fresh():
+                version = self._version
+                loaded_at = time.monotonic()
+
+                data: T_Membership = {}
+                async with use_ac_session() as session:
+                    stmt = select(
+                        self.orm_class.service, self.orm_class.subject, func.count()
+                    ).group_by(self.orm_class.service, self.orm_class.subject)
+                    for service, subject, cnt in await session.execute(stmt):
+                        data.setdefault(service, {})[subject] = cnt
+
+                # 加载期间若发生写入，则下次再重新加载
+                if version != self._version:
+                    return data
+                self.data = data
+                self._loaded_at = loaded_at
+            return self.data
+
+    async def get(self) -> Optional[T_Membership]:
+        # 未启用时返回None
+        if not self.enabled:
+            return None
+        if self._is_fresh():
+            return self.data
+        return await self.load()
+
+    async def contains(self, service: str, subject: Optional[str] = None) -> bool:
+        # 返回False时一定不存在，返回True时可能存在
+        data = await self.get()
+        if data is None:
+            return True
+
+        subjects = data.get(service)
+        if not subjects:
+            return False
+        return subject is None or subject in subjects
+
+    async def contains_any(self, service: str, subjects: Iterable[str]) -> bool:
+        data = await self.get()
+        if data is None:
+            return True
+
+        existing = data.get(service)
+        if not existing:
+            return False
+        return any(sub in existing for sub in subjects)
+
+    def add(self, service: str, subject: str):
+        self._version += 1
+        if self.data is not None:
+            subjects = self.data.setdefault(service, {})
+            subjects[subject] = subjects.get(subject, 0) + 1
+
+    def add_if_absent(self, service: str, subject: str):
+        # 用于每个服务与主体至多只有一行的表
+        self._version += 1
+        if self.data is not None:
+            self.data.setdefault(service, {}).setdefault(subject, 1)
+
+    def remove(self, service: str, subject: str):
+        self._version += 1
+        if self.data is not None:
+            subjects = self.data.get(service, {})
+            cnt = subjects.get(subject, 0) - 1
+            if cnt > 0:
+                subjects[subject] = cnt
+            else:
+                subjects.pop(subject, None)
+                if len(subjects) == 0:
+                    self.data.pop(service, None)
+
+    def reset(self):
+        self._version += 1
+        self.data = None
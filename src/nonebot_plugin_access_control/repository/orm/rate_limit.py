@@ -1,3 +1,4 @@
+from typing import Optional
 from datetime import datetime
 
 from shortuuid import ShortUUID
@@ -27,10 +28,17 @@ class RateLimitRuleOrm(MappedAsDataclass, Model):
     time_span: Mapped[int]  # 单位：秒
     limit: Mapped[int]
     overwrite: Mapped[bool]
+    # window：每time_span内最多调用limit次
+    # bucket：令牌桶，容量为capacity，每time_span补充limit个令牌
+    kind: Mapped[str] = mapped_column(default="window", server_default="window")
+    capacity: Mapped[Optional[int]] = mapped_column(default=None)
 
     tokens: Mapped[list["RateLimitTokenOrm"]] = relationship(
         init=False, back_populates="rule", cascade="delete"
     )
+    buckets: Mapped[list["RateLimitBucketOrm"]] = relationship(
+        init=False, back_populates="rule", cascade="delete"
+    )
 
 
 class RateLimitTokenOrm(MappedAsDataclass, Model):
@@ -38,6 +46,12 @@ class RateLimitTokenOrm(MappedAsDataclass, Model):
     __table_args__ = (
         Index("ix_accctrl_rate_limit_token_rule_id", "rule_id"),
         Index("ix_accctrl_rate_limit_token_expire_time", "expire_time"),
+        Index(
+            "ix_accctrl_rate_limit_token_rule_id_user_expire_time",
+            "rule_id",
+            "user",
+            "expire_time",
+        ),
         {"extend_existing": True},
     )
 
@@ -48,3 +62,17 @@ class RateLimitTokenOrm(MappedAsDataclass, Model):
     expire_time: Mapped[datetime] = mapped_column()
 
     rule: Mapped[RateLimitRuleOrm] = relationship(init=False, back_populates="tokens")
+
+
+class RateLimitBucketOrm(MappedAsDataclass, Model):
+    __tablename__ = "accctrl_rate_limit_bucket"
+    __table_args__ = {"extend_existing": True}
+
+    rule_id: Mapped[str] = mapped_column(
+        ForeignKey("accctrl_rate_limit_rule.id"), primary_key=True
+    )
+    user: Mapped[str] = mapped_column(primary_key=True)
+    tokens: Mapped[float]
+    last_refill: Mapped[float]  # 时间戳，单位：秒
+
+    rule: Mapped[RateLimitRuleOrm] = relationship(init=False, back_populates="buckets")
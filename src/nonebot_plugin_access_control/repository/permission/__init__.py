@@ -1,4 +1,20 @@
-from . import impl  # noqa
+from nonebot import logger
+
+from ...config import conf
 from .interface import IPermissionRepository
 
+if conf().access_control_permission_storage == "datastore":
+    from . import impl  # noqa
+
+    logger.opt(colors=True).info("use <y>datastore</y> permission storage")
+elif conf().access_control_permission_storage == "inmemory":
+    from . import inmemory  # noqa
+
+    logger.opt(colors=True).info("use <y>inmemory</y> permission storage")
+else:
+    raise RuntimeError(
+        f"invalid access_control_permission_storage: "
+        f"{conf().access_control_permission_storage}"
+    )
+
 __all__ = ("IPermissionRepository",)
@@ -0,0 +1,81 @@
+from typing import Optional
+from collections.abc import Mapping, Sequence
+
+from nonebot_plugin_access_control_api.service.interface import IService
+from nonebot_plugin_access_control_api.models.permission import Permission
+
+T_DecisionTable = Mapping[str, Permission]
+
+_EMPTY_TABLE: T_DecisionTable = {}
+
+
+class PermissionCompiler:
+    """
+    将服务树上每个节点从祖先继承的权限展开为一张表（subject -> Permission），
+    使得鉴权时每个主体只需一次字典查询
+    """
+
+    def __init__(self, data: Mapping[str, Mapping[str, bool]]):
+        # service -> subject -> allow
+        self.data = data
+        self.tables: dict[str, T_DecisionTable] = {}
+
+    def _compile_node(
+        self, service: IService, parent_table: T_DecisionTable
+    ) -> T_DecisionTable:
+        permissions = self.data.get(service.qualified_name)
+        if not permissions:
+            # 自身没有配置权限的服务直接复用父服务的表
+            table = parent_table
+        else:
+            table = {
+                **parent_table,
+                **{
+                    sub: Permission(service, sub, allow)
+                    for sub, allow in permissions.items()
+                },
+            }
+
+        self.tables[service.qualified_name] = table
+        return table
+
+    def _compile_subtree(self, root: IService, parent_table: T_DecisionTable):
+        sta = [(root, parent_table)]
+        while len(sta) != 0:
+            node, table = sta.pop()
+            table = self._compile_node(node, table)
+            sta.extend((child, table) for child in node.children)
+
+    def compile(self, root: IService):
+        self.tables.clear()
+        self._compile_subtree(root, _EMPTY_TABLE)
+
+    def recompile(self, service: IService):
+        parent = service.parent
+        if parent is not None:
+            parent_table = self.get_table(parent)
+        else:
+            parent_table = _EMPTY_TABLE
+        self._compile_subtree(service, parent_table)
+
+    def get_table(self, service: IService) -> T_DecisionTable:
+        table = self.tables.get(service.qualified_name)
+        if table is None:
+            # 编译后才创建的服务
+            parent = service.parent
+            if parent is not None:
+                parent_table = self.get_table(parent)
+            else:
+                parent_table = _EMPTY_TABLE
+            table = self._compile_node(service, parent_table)
+        return table
+
+    def resolve(
+        self, service: IService, subjects: Sequence[str]
+    ) -> Optional[Permission]:
+        table = self.get_table(service)
+        for sub in subjects:
+            p = table.get(sub)
+            if p is not None:
+                return p
+        return None
@@ -1,42 +1,191 @@
-from typing import Optional
-from collections.abc import AsyncGenerator
+from typing import Any, Optional
+from collections.abc import Iterable, Sequence, Collection, AsyncGenerator
 
-from sqlalchemy import select
+from sqlalchemy.engine import Dialect
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from nonebot_plugin_access_control_api.context import context
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
 from nonebot_plugin_access_control_api.service.interface import IService
 from nonebot_plugin_access_control_api.models.permission import Permission
-from nonebot_plugin_access_control_api.service.interface.nonebot_service import (
-    INoneBotService,
-)
 
+from ...config import conf
 from ..utils import use_ac_session
+from ..membership import SubjectMembership
 from ..orm.permission import PermissionOrm
 from .interface import IPermissionRepository
+from ..service_index import get_service_by_qualified_name
+
+# 批量写入权限时每条语句包含的(服务, 主体)数量
+SET_PERMISSIONS_CHUNK_SIZE = 500
+
+
+def _on_conflict_upsert(dialect_name: str, rows: list[dict[str, Any]]):
+    # 仅当插入新行或allow发生变化时返回该行
+    if dialect_name == "sqlite":
+        stmt = sqlite_insert(PermissionOrm)
+    else:
+        stmt = postgresql_insert(PermissionOrm)
+    stmt = stmt.values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[PermissionOrm.subject, PermissionOrm.service],
+        set_={"allow": stmt.excluded.allow},
+        where=PermissionOrm.allow != stmt.excluded.allow,
+    ).returning(PermissionOrm.service, PermissionOrm.subject)
+
+
+def _membership_ttl() -> float:
+    if conf().access_control_permission_cache_size <= 0:
+        return 0
+    return conf().access_control_permission_cache_ttl
+
+
+def _supports_on_conflict_returning(dialect: Dialect) -> bool:
+    # SQLite需要3.35及以上版本才支持RETURNING
+    return dialect.name in ("sqlite", "postgresql") and dialect.insert_returning
 
 
 @context.bind_singleton_to(IPermissionRepository)
 class PermissionRepository(IPermissionRepository):
+    def __init__(self):
+        # 与鉴权结果的缓存一同启用
+        self.membership = SubjectMembership(PermissionOrm, _membership_ttl)
+
     async def get_permissions(
-        self, service: Optional[IService], subject: Optional[str]
+        self,
+        service: Optional[IService],
+        subject: Optional[str],
+        *,
+        offset: int = 0,
+        limit: Optional[int] = None,
     ) -> AsyncGenerator[Permission, None]:
+        if service is not None and not await self.membership.contains(
+            service.qualified_name, subject
+        ):
+            return
+
         async with use_ac_session() as session:
             stmt = select(PermissionOrm)
             if service is not None:
                 stmt = stmt.where(PermissionOrm.service == service.qualified_name)
             if subject is not None:
                 stmt = stmt.where(PermissionOrm.subject == subject)
+            if offset != 0 or limit is not None:
+                stmt = (
+                    stmt.order_by(
+                        PermissionOrm.service,
+                        PermissionOrm.allow,
+                        PermissionOrm.subject,
+                    )
+                    .offset(offset)
+                    .limit(limit)
+                )
 
             async for x in await session.stream_scalars(stmt):
                 s = service
                 if s is None:
-                    s = context.require(INoneBotService).get_service_by_qualified_name(
-                        x.service
-                    )
+                    s = get_service_by_qualified_name(x.service)
                 if s is not None:
                     yield Permission(s, x.subject, x.allow)
 
+    async def get_permissions_of_services(
+        self, services: Sequence[IService], subjects: Collection[str]
+    ) -> AsyncGenerator[Permission, None]:
+        services_by_name = {
+            s.qualified_name: s
+            for s in services
+            if await self.membership.contains_any(s.qualified_name, subjects)
+        }
+        if len(services_by_name) == 0:
+            return
+
+        async with use_ac_session() as session:
+            stmt = select(PermissionOrm).where(
+                PermissionOrm.service.in_(services_by_name.keys()),
+                PermissionOrm.subject.in_(subjects),
+            )
+            for x in (await session.execute(stmt)).scalars():
+                yield Permission(services_by_name[x.service], x.subject, x.allow)
+
+    async def resolve_permission(
+        self, services: Sequence[IService], subjects: Sequence[str]
+    ) -> Optional[Permission]:
+        # 服务与主体均按优先级从高到低排列，重复出现时以第一次出现为准
+        service_rank: dict[str, tuple[int, IService]] = {}
+        for i, s in enumerate(services):
+            service_rank.setdefault(s.qualified_name, (i, s))
+        subject_rank: dict[str, int] = {}
+        for i, sub in enumerate(subjects):
+            subject_rank.setdefault(sub, i)
+
+        # 只查询存在数据行的服务
+        service_names = [
+            name
+            for name in service_rank
+            if await self.membership.contains_any(name, subject_rank)
+        ]
+
+        if len(service_names) == 0:
+            return None
+
+        async with use_ac_session() as session:
+            stmt = select(PermissionOrm).where(
+                PermissionOrm.service.in_(service_names),
+                PermissionOrm.subject.in_(subject_rank.keys()),
+            )
+
+            # 先按主体优先级，再按服务深度从深到浅选出生效的权限
+            result = None
+            result_rank = None
+            for x in (await session.execute(stmt)).scalars():
+                rank = (subject_rank[x.subject], service_rank[x.service][0])
+                if result_rank is None or rank < result_rank:
+                    result, result_rank = x, rank
+
+            if result is None:
+                return None
+            return Permission(
+                service_rank[result.service][1], result.subject, result.allow
+            )
+
     async def set_permission(
         self, service: Optional[IService], subject: str, allow: bool
+    ) -> bool:
+        async with use_ac_session() as sess:
+            dialect = sess.get_bind(PermissionOrm).dialect
+            row = {
+                "service": service.qualified_name,
+                "subject": subject,
+                "allow": allow,
+            }
+
+            if _supports_on_conflict_returning(dialect):
+                stmt = _on_conflict_upsert(dialect.name, [row])
+                ok = (await sess.execute(stmt)).first() is not None
+            elif dialect.name == "mysql":
+                # SQLAlchemy的MySQL驱动总是设置CLIENT_FOUND_ROWS，
+                # 此时插入新行与值未变化的影响行数均为1，值发生变化为2
+                # 其他进程也可能写入，因此需查询数据库
+                stmt = select(func.count()).where(
+                    PermissionOrm.service == service.qualified_name,
+                    PermissionOrm.subject == subject,
+                )
+                existed = (await sess.execute(stmt)).scalar_one() > 0
+                stmt = mysql_insert(PermissionOrm).values(row)
+                stmt = stmt.on_duplicate_key_update(allow=stmt.inserted.allow)
+                rowcount = (await sess.execute(stmt)).rowcount
+                ok = rowcount == 2 or (rowcount == 1 and not existed)
+            else:
+                return await self._set_permission_by_orm(service, subject, allow)
+
+            await sess.commit()
+            if ok:
+                self.membership.add_if_absent(service.qualified_name, subject)
+            return ok
+
+    async def _set_permission_by_orm(
+        self, service: IService, subject: str, allow: bool
     ) -> bool:
         async with use_ac_session() as sess:
             stmt = select(PermissionOrm).where(
@@ -56,10 +205,82 @@ class PermissionRepository(IPermissionRepository):
 
             if old_allow != allow:
                 await sess.commit()
+                if old_allow is None:
+                    self.membership.add(service.qualified_name, subject)
                 return True
             else:
                 return False
 
+    async def set_permissions(
+        self, permissions: Iterable[Permission]
+    ) -> list[Permission]:
+        # 同一服务与主体重复出现时以最后一次为准
+        wanted: dict[tuple[str, str], Permission] = {}
+        for p in permissions:
+            wanted[(p.service.qualified_name, p.subject)] = p
+
+        if len(wanted) == 0:
+            return []
+
+        async with use_ac_session() as sess:
+            dialect = sess.get_bind(PermissionOrm).dialect
+            if not _supports_on_conflict_returning(dialect):
+                return await self._set_permissions_by_orm(wanted)
+
+            keys = list(wanted.keys())
+            changed_keys = []
+            for i in range(0, len(keys), SET_PERMISSIONS_CHUNK_SIZE):
+                rows = [
+                    {"service": k[0], "subject": k[1], "allow": wanted[k].allow}
+                    for k in keys[i : i + SET_PERMISSIONS_CHUNK_SIZE]
+                ]
+                stmt = _on_conflict_upsert(dialect.name, rows)
+                changed_keys.extend((await sess.execute(stmt)).all())
+
+            # 在同一个事务中写入
+            await sess.commit()
+            for service, subject in changed_keys:
+                self.membership.add_if_absent(service, subject)
+
+            return [wanted[(service, subject)] for service, subject in changed_keys]
+
+    async def _set_permissions_by_orm(
+        self, wanted: dict[tuple[str, str], Permission]
+    ) -> list[Permission]:
+        async with use_ac_session() as sess:
+            existing: dict[tuple[str, str], PermissionOrm] = {}
+            keys = list(wanted.keys())
+            for i in range(0, len(keys), SET_PERMISSIONS_CHUNK_SIZE):
+                stmt = select(PermissionOrm).where(
+                    tuple_(PermissionOrm.service, PermissionOrm.subject).in_(
+                        keys[i : i + SET_PERMISSIONS_CHUNK_SIZE]
+                    )
+                )
+                for x in (await sess.execute(stmt)).scalars():
+                    existing[(x.service, x.subject)] = x
+
+            changed = []
+            inserted = []
+            for key, p in wanted.items():
+                x = existing.get(key)
+                if x is None:
+                    sess.add(
+                        PermissionOrm(service=key[0], subject=p.subject, allow=p.allow)
+                    )
+                    inserted.append(key)
+                    changed.append(p)
+                elif x.allow != p.allow:
+                    x.allow = p.allow
+                    changed.append(p)
+
+            # 在同一个事务中写入
+            if len(changed) != 0:
+                await sess.commit()
+                for service, subject in inserted:
+                    self.membership.add(service, subject)
+
+            return changed
+
     async def remove_permission(
         self, service: Optional[IService], subject: str
     ) -> bool:
@@ -74,4 +295,5 @@ class PermissionRepository(IPermissionRepository):
 
             await sess.delete(p)
             await sess.commit()
+            self.membership.remove(service.qualified_name, subject)
             return True
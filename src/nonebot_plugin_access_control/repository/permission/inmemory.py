@@ -0,0 +1,172 @@
+from typing import Optional
+from collections.abc import Iterable, Sequence, Collection, AsyncGenerator
+
+from sqlalchemy import select
+from nonebot import get_driver
+from nonebot_plugin_access_control_api.context import context
+from nonebot_plugin_access_control_api.service.interface import IService
+from nonebot_plugin_access_control_api.models.permission import Permission
+from nonebot_plugin_access_control_api.service.interface.nonebot_service import (
+    INoneBotService,
+)
+
+from ...utils.lock import LazyLock
+from ..utils import use_ac_session
+from .impl import PermissionRepository
+from .compiler import PermissionCompiler
+from ..orm.permission import PermissionOrm
+from .interface import IPermissionRepository
+from ..service_index import get_service_by_qualified_name
+
+
+def _is_trace(services: Sequence[IService]) -> bool:
+    # services是否为某个服务到根服务的完整路径
+    if len(services) == 0 or services[-1].parent is not None:
+        return False
+    for i in range(len(services) - 1):
+        if services[i].parent is not services[i + 1]:
+            return False
+    return True
+
+
+@context.bind_singleton_to(IPermissionRepository)
+class InmemoryPermissionRepository(PermissionRepository):
+    def __init__(self):
+        super().__init__()
+
+        # service -> subject -> allow
+        self.data: Optional[dict[str, dict[str, bool]]] = None
+        self.compiler: Optional[PermissionCompiler] = None
+        self._load_lock = LazyLock()
+
+        get_driver().on_startup(self.load)
+
+    async def load(self) -> dict[str, dict[str, bool]]:
+        async with self._load_lock:
+            if self.data is None:
+                data: dict[str, dict[str, bool]] = {}
+                async with use_ac_session() as session:
+                    async for x in await session.stream_scalars(select(PermissionOrm)):
+                        data.setdefault(x.service, {})[x.subject] = x.allow
+
+                compiler = PermissionCompiler(data)
+                compiler.compile(context.require(INoneBotService))
+
+                self.data = data
+                self.compiler = compiler
+            return self.data
+
+    def reset(self):
+        self.data = None
+        self.compiler = None
+
+    async def _get_data(self) -> dict[str, dict[str, bool]]:
+        if self.data is not None:
+            return self.data
+        return await self.load()
+
+    async def get_permissions(
+        self,
+        service: Optional[IService],
+        subject: Optional[str],
+        *,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> AsyncGenerator[Permission, None]:
+        if offset != 0 or limit is not None:
+            permissions = sorted(
+                [x async for x in self.get_permissions(service, subject)],
+                key=lambda x: (x.service.qualified_name, x.allow, x.subject),
+            )
+            end = offset + limit if limit is not None else None
+            for x in permissions[offset:end]:
+                yield x
+            return
+
+        data = await self._get_data()
+
+        if service is not None:
+            items = [(service.qualified_name, data.get(service.qualified_name, {}))]
+        else:
+            items = list(data.items())
+
+        for service_name, permissions in items:
+            s = service
+            if s is None:
+                s = get_service_by_qualified_name(service_name)
+            if s is None:
+                continue
+
+            if subject is not None:
+                if subject in permissions:
+                    yield Permission(s, subject, permissions[subject])
+            else:
+                for sub, allow in list(permissions.items()):
+                    yield Permission(s, sub, allow)
+
+    async def get_permissions_of_services(
+        self, services: Sequence[IService], subjects: Collection[str]
+    ) -> AsyncGenerator[Permission, None]:
+        data = await self._get_data()
+
+        for s in services:
+            permissions = data.get(s.qualified_name, {})
+            for sub in subjects:
+                allow = permissions.get(sub)
+                if allow is not None:
+                    yield Permission(s, sub, allow)
+
+    async def resolve_permission(
+        self, services: Sequence[IService], subjects: Sequence[str]
+    ) -> Optional[Permission]:
+        data = await self._get_data()
+
+        if _is_trace(services):
+            return self.compiler.resolve(services[0], subjects)
+
+        for sub in subjects:
+            for s in services:
+                allow = data.get(s.qualified_name, {}).get(sub)
+                if allow is not None:
+                    return Permission(s, sub, allow)
+        return None
+
+    async def set_permission(
+        self, service: Optional[IService], subject: str, allow: bool
+    ) -> bool:
+        data = await self._get_data()
+
+        ok = await super().set_permission(service, subject, allow)
+        if ok:
+            data.setdefault(service.qualified_name, {})[subject] = allow
+            self.compiler.recompile(service)
+        return ok
+
+    async def set_permissions(
+        self, permissions: Iterable[Permission]
+    ) -> list[Permission]:
+        data = await self._get_data()
+
+        changed = await super().set_permissions(permissions)
+
+        services = {}
+        for p in changed:
+            data.setdefault(p.service.qualified_name, {})[p.subject] = p.allow
+            services[p.service.qualified_name] = p.service
+        for service in services.values():
+            self.compiler.recompile(service)
+        return changed
+
+    async def remove_permission(
+        self, service: Optional[IService], subject: str
+    ) -> bool:
+        data = await self._get_data()
+
+        ok = await super().remove_permission(service, subject)
+        if ok:
+            permissions = data.get(service.qualified_name, {})
+            permissions.pop(subject, None)
+            if len(permissions) == 0:
+                data.pop(service.qualified_name, None)
+            self.compiler.recompile(service)
+        return ok
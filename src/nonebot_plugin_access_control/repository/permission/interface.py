@@ -1,5 +1,5 @@
 from typing import Optional, Protocol
-from collections.abc import AsyncGenerator
+from collections.abc import Iterable, Sequence, Collection, AsyncGenerator
 
 from nonebot_plugin_access_control_api.service.interface import IService
 from nonebot_plugin_access_control_api.models.permission import Permission
@@ -7,16 +7,39 @@ from nonebot_plugin_access_control_api.models.permission import Permission
 
 class IPermissionRepository(Protocol):
     async def get_permissions(
-        self, service: Optional[IService], subject: Optional[str]
+        self,
+        service: Optional[IService],
+        subject: Optional[str],
+        *,
+        offset: int = 0,
+        limit: Optional[int] = None,
     ) -> AsyncGenerator[Permission, None]:
+        # 指定offset或limit时，按照服务全称、allow、主体排序
         raise NotImplementedError()
         yield Permission()  # noqa
 
+    async def get_permissions_of_services(
+        self, services: Sequence[IService], subjects: Collection[str]
+    ) -> AsyncGenerator[Permission, None]:
+        raise NotImplementedError()
+        yield Permission()  # noqa
+
+    async def resolve_permission(
+        self, services: Sequence[IService], subjects: Sequence[str]
+    ) -> Optional[Permission]:
+        raise NotImplementedError()
+
     async def set_permission(
         self, service: Optional[IService], subject: str, allow: bool
     ) -> bool:
         raise NotImplementedError()
 
+    async def set_permissions(
+        self, permissions: Iterable[Permission]
+    ) -> list[Permission]:
+        # 返回实际发生变更的权限
+        raise NotImplementedError()
+
     async def remove_permission(
         self, service: Optional[IService], subject: str
     ) -> bool:
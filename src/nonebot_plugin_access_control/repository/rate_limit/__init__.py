@@ -1,4 +1,5 @@
 from . import impl  # noqa
 from .interface import IRateLimitRepository
+from .models import T_RateLimitRuleKind, TokenBucketRateLimitRule
 
-__all__ = ("IRateLimitRepository",)
+__all__ = ("IRateLimitRepository", "T_RateLimitRuleKind", "TokenBucketRateLimitRule")
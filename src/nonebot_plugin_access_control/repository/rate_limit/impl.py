@@ -7,19 +7,44 @@ from nonebot_plugin_access_control_api.context import context
 from nonebot_plugin_access_control_api.service.interface import IService
 from nonebot_plugin_access_control_api.errors import AccessControlQueryError
 from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
-from nonebot_plugin_access_control_api.service.interface.nonebot_service import (
-    INoneBotService,
-)
 
 from ..utils import use_ac_session
 from .interface import IRateLimitRepository
 from ..orm.rate_limit import RateLimitRuleOrm
+from ..service_index import get_service_by_qualified_name
+from .models import T_RateLimitRuleKind, TokenBucketRateLimitRule
+
+
+def _map_rule(orm: RateLimitRuleOrm, service: IService) -> RateLimitRule:
+    if orm.kind == "bucket":
+        return TokenBucketRateLimitRule(
+            orm.id,
+            service,
+            orm.subject,
+            timedelta(seconds=orm.time_span),
+            orm.limit,
+            orm.overwrite,
+            orm.capacity if orm.capacity is not None else orm.limit,
+        )
+    return RateLimitRule(
+        orm.id,
+        service,
+        orm.subject,
+        timedelta(seconds=orm.time_span),
+        orm.limit,
+        orm.overwrite,
+    )
 
 
 @context.bind_singleton_to(IRateLimitRepository)
 class RateLimitRepository(IRateLimitRepository):
     async def get_rules_by_subject(
-        self, service: Optional[IService], subject: Optional[str]
+        self,
+        service: Optional[IService],
+        subject: Optional[str],
+        *,
+        offset: int = 0,
+        limit: Optional[int] = None,
     ) -> AsyncGenerator[RateLimitRuleOrm, None]:
         async with use_ac_session() as session:
             stmt = select(RateLimitRuleOrm)
@@ -27,22 +52,23 @@ class RateLimitRepository(IRateLimitRepository):
                 stmt = stmt.where(RateLimitRuleOrm.service == service.qualified_name)
             if subject is not None:
                 stmt = stmt.where(RateLimitRuleOrm.subject == subject)
+            if offset != 0 or limit is not None:
+                stmt = (
+                    stmt.order_by(
+                        RateLimitRuleOrm.service,
+                        RateLimitRuleOrm.subject,
+                        RateLimitRuleOrm.id,
+                    )
+                    .offset(offset)
+                    .limit(limit)
+                )
 
             async for x in await session.stream_scalars(stmt):
                 s = service
                 if s is None:
-                    s = context.require(INoneBotService).get_service_by_qualified_name(
-                        x.service
-                    )
+                    s = get_service_by_qualified_name(x.service)
                 if s is not None:
-                    yield RateLimitRule(
-                        x.id,
-                        s,
-                        x.subject,
-                        timedelta(seconds=x.time_span),
-                        x.limit,
-                        x.overwrite,
-                    )
+                    yield _map_rule(x, s)
 
     async def add_rate_limit_rule(
         self,
@@ -51,6 +77,9 @@ class RateLimitRepository(IRateLimitRepository):
         time_span: timedelta,
         limit: int,
         overwrite: bool = False,
+        *,
+        kind: T_RateLimitRuleKind = "window",
+        capacity: Optional[int] = None,
     ) -> RateLimitRule:
         async with use_ac_session() as sess:
             if overwrite:
@@ -69,15 +98,15 @@ class RateLimitRepository(IRateLimitRepository):
                 time_span=int(time_span.total_seconds()),
                 limit=limit,
                 overwrite=overwrite,
+                kind=kind,
+                capacity=capacity if kind == "bucket" else None,
             )
             sess.add(orm)
             await sess.commit()
 
             await sess.refresh(orm)
 
-            rule = RateLimitRule(orm.id, service, subject, time_span, limit, overwrite)
-
-            return rule
+            return _map_rule(orm, service)
 
     async def remove_rate_limit_rule(self, rule_id: str) -> Optional[RateLimitRule]:
         async with use_ac_session() as sess:
@@ -88,17 +117,5 @@ class RateLimitRepository(IRateLimitRepository):
             await sess.delete(orm)
             await sess.commit()
 
-            service = context.require(INoneBotService).get_service_by_qualified_name(
-                orm.service
-            )
-
-            rule = RateLimitRule(
-                orm.id,
-                service,
-                orm.subject,
-                timedelta(seconds=orm.time_span),
-                orm.limit,
-                orm.overwrite,
-            )
-
-            return rule
+            service = get_service_by_qualified_name(orm.service)
+            return _map_rule(orm, service)
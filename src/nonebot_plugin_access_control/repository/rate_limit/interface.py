@@ -5,13 +5,20 @@ from collections.abc import AsyncGenerator
 from nonebot_plugin_access_control_api.service.interface import IService
 from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
 
+from .models import T_RateLimitRuleKind
 from ..orm.rate_limit import RateLimitRuleOrm
 
 
 class IRateLimitRepository(Protocol):
     async def get_rules_by_subject(
-        self, service: Optional[IService], subject: Optional[str]
+        self,
+        service: Optional[IService],
+        subject: Optional[str],
+        *,
+        offset: int = 0,
+        limit: Optional[int] = None,
     ) -> AsyncGenerator[RateLimitRuleOrm, None]:
+        # 指定offset或limit时，按照服务全称、主体、规则ID排序
         raise NotImplementedError()
         yield RateLimitRuleOrm()  # noqa
 
@@ -22,7 +29,11 @@ class IRateLimitRepository(Protocol):
         time_span: timedelta,
         limit: int,
         overwrite: bool = False,
+        *,
+        kind: T_RateLimitRuleKind = "window",
+        capacity: Optional[int] = None,
     ) -> RateLimitRule:
+        # kind为bucket时，capacity为令牌桶容量，缺省时与limit相同
         raise NotImplementedError()
 
     async def remove_rate_limit_rule(self, rule_id: str) -> Optional[RateLimitRule]:
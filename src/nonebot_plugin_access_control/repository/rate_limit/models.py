@@ -0,0 +1,28 @@
+from typing import Literal
+from datetime import timedelta
+
+from nonebot_plugin_access_control_api.service.interface import IService
+from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
+
+T_RateLimitRuleKind = Literal["window", "bucket"]
+
+
+class TokenBucketRateLimitRule(RateLimitRule):
+    # 令牌桶规则：桶容量为capacity，每time_span补充limit个令牌
+
+    def __new__(
+        cls,
+        id: str,
+        service: IService,
+        subject: str,
+        time_span: timedelta,
+        limit: int,
+        overwrite: bool,
+        capacity: int,
+    ):
+        self = super().__new__(cls, id, service, subject, time_span, limit, overwrite)
+        self.capacity = capacity
+        return self
+
+    def __repr__(self) -> str:
+        return f"{super().__repr__()[:-1]}, capacity={self.capacity})"
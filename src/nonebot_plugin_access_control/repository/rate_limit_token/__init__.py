@@ -1,7 +1,7 @@
 from nonebot import logger
 
 from ...config import conf
-from .interface import IRateLimitTokenRepository
+from .interface import AcquireTokensResult, IRateLimitTokenRepository
 
 if conf().access_control_rate_limit_token_storage == "datastore":
     from . import datastore  # noqa
@@ -11,10 +11,18 @@ elif conf().access_control_rate_limit_token_storage == "inmemory":
     from . import inmemory  # noqa
 
     logger.opt(colors=True).info("use <y>inmemory</y> rate_limit_token storage")
+elif conf().access_control_rate_limit_token_storage == "gcra":
+    from . import gcra  # noqa
+
+    logger.opt(colors=True).info("use <y>gcra</y> rate_limit_token storage")
+elif conf().access_control_rate_limit_token_storage == "hybrid":
+    from . import hybrid  # noqa
+
+    logger.opt(colors=True).info("use <y>hybrid</y> rate_limit_token storage")
 else:
     raise RuntimeError(
         f"invalid access_control_rate_limit_token_storage: "
         f"{conf().access_control_rate_limit_token_storage}"
     )
 
-__all__ = ("IRateLimitTokenRepository",)
+__all__ = ("AcquireTokensResult", "IRateLimitTokenRepository")
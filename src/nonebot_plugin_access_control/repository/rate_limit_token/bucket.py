@@ -0,0 +1,134 @@
+import time
+from datetime import datetime
+from typing import Optional, NamedTuple
+
+from nonebot_plugin_access_control_api.models.rate_limit import RateLimitSingleToken
+
+from ..rate_limit import TokenBucketRateLimitRule
+
+# 令牌桶规则获取的token不单独保存，id固定为0
+BUCKET_TOKEN_ID = 0
+
+
+class BucketKey(NamedTuple):
+    rule_id: str
+    user: str
+
+
+class BucketState:
+    # rate、capacity随规则一同保存，使得清理时无需查询规则
+    __slots__ = ("tokens", "last_refill", "rate", "capacity")
+
+    def __init__(self, tokens: float, last_refill: float, rate: float, capacity: int):
+        self.tokens = tokens
+        self.last_refill = last_refill
+        self.rate = rate
+        self.capacity = capacity
+
+    def refill(self, now: float) -> float:
+        elapsed = max(now - self.last_refill, 0.0)
+        return min(float(self.capacity), self.tokens + elapsed * self.rate)
+
+
+def refill_rate(rule: TokenBucketRateLimitRule) -> float:
+    # 每秒补充的令牌数
+    return rule.limit / rule.time_span.total_seconds()
+
+
+def available_time(rule: TokenBucketRateLimitRule, tokens: float, now: float) -> float:
+    # 桶内令牌数达到1的时间
+    if tokens >= 1:
+        return now
+    return now + (1 - tokens) / refill_rate(rule)
+
+
+def make_token(
+    rule: TokenBucketRateLimitRule, user: str, now: float
+) -> RateLimitSingleToken:
+    # 过期时间为补充一个令牌所需的时间
+    acquire_time = datetime.utcfromtimestamp(now)
+    expire_time = datetime.utcfromtimestamp(now + 1 / refill_rate(rule))
+    return RateLimitSingleToken(
+        BUCKET_TOKEN_ID, rule.id, user, acquire_time, expire_time
+    )
+
+
+def make_first_expire_token(
+    rule: TokenBucketRateLimitRule, user: str, tokens: float, now: float
+) -> Optional[RateLimitSingleToken]:
+    # 返回一个虚拟token，其过期时间为下一个令牌的可用时间
+    if tokens >= 1:
+        return None
+
+    t = available_time(rule, tokens, now)
+    return RateLimitSingleToken(
+        BUCKET_TOKEN_ID,
+        rule.id,
+        user,
+        datetime.utcfromtimestamp(t - 1 / refill_rate(rule)),
+        datetime.utcfromtimestamp(t),
+    )
+
+
+class InmemoryBuckets:
+    """
+    在内存中保存每个(规则, 用户)的令牌桶
+    """
+
+    def __init__(self):
+        self.data: dict[BucketKey, BucketState] = {}
+
+    def _get_tokens(
+        self, rule: TokenBucketRateLimitRule, user: str, now: float
+    ) -> float:
+        state = self.data.get(BucketKey(rule.id, user))
+        if state is None:
+            return float(rule.capacity)
+        return state.refill(now)
+
+    def get_first_expire_token(
+        self, rule: TokenBucketRateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        now = time.time()
+        return make_first_expire_token(
+            rule, user, self._get_tokens(rule, user, now), now
+        )
+
+    def acquire_token(
+        self, rule: TokenBucketRateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        now = time.time()
+        tokens = self._get_tokens(rule, user, now)
+        if tokens < 1:
+            return None
+
+        key = BucketKey(rule.id, user)
+        state = self.data.get(key)
+        if state is None:
+            self.data[key] = BucketState(
+                tokens - 1, now, refill_rate(rule), rule.capacity
+            )
+        else:
+            state.tokens = tokens - 1
+            state.last_refill = now
+            state.rate = refill_rate(rule)
+            state.capacity = rule.capacity
+        return make_token(rule, user, now)
+
+    def retire_token(self, token: RateLimitSingleToken):
+        # 归还一个令牌，超出容量的部分在下次补充时截断
+        state = self.data.get(BucketKey(token.rule_id, token.user))
+        if state is not None:
+            state.tokens += 1
+
+    def delete_full_buckets(self):
+        # 已补满的桶与不存在的桶等价，可以删除
+        now = time.time()
+        del_keys = [
+            k for k, state in self.data.items() if state.refill(now) >= state.capacity
+        ]
+        for k in del_keys:
+            del self.data[k]
+
+    def clear(self):
+        self.data = {}
@@ -3,21 +3,177 @@ from nonebot_plugin_access_control_api.context import context
 
 require("nonebot_plugin_apscheduler")
 
-from typing import Optional
+import time
+from asyncio import sleep
 from datetime import datetime
+from typing import Any, Optional
+from collections.abc import Sequence
 
 from loguru import logger
-from sqlalchemy import func, delete, select
+from sqlalchemy.exc import IntegrityError
+from nonebot_plugin_orm import get_session
+from sqlalchemy.ext.asyncio import AsyncSession
 from nonebot_plugin_apscheduler import scheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import case, func, delete, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
 from nonebot_plugin_access_control_api.models.rate_limit import (
     RateLimitRule,
     RateLimitSingleToken,
 )
 
+from ...config import conf
 from ..utils import use_ac_session
-from .interface import IRateLimitTokenRepository
-from ..orm.rate_limit import RateLimitRuleOrm, RateLimitTokenOrm
+from ..rate_limit import TokenBucketRateLimitRule
+from .interface import AcquireTokensResult, IRateLimitTokenRepository
+from ..orm.rate_limit import RateLimitRuleOrm, RateLimitTokenOrm, RateLimitBucketOrm
+from .bucket import BUCKET_TOKEN_ID, make_token, refill_rate, make_first_expire_token
+
+
+async def _consume_bucket_token(
+    sess: AsyncSession, rule: TokenBucketRateLimitRule, user: str, now: float
+) -> bool:
+    # 补充与扣减在同一条UPDATE中完成，只有令牌数不少于1时才会更新
+    # 各进程的时钟可能不一致，经过的时间不小于0，last_refill也不回退
+    elapsed = case(
+        (RateLimitBucketOrm.last_refill < now, now - RateLimitBucketOrm.last_refill),
+        else_=0.0,
+    )
+    refilled = RateLimitBucketOrm.tokens + elapsed * refill_rate(rule)
+    stmt = (
+        update(RateLimitBucketOrm)
+        .where(
+            RateLimitBucketOrm.rule_id == rule.id,
+            RateLimitBucketOrm.user == user,
+            refilled >= 1,
+        )
+        .values(
+            tokens=case(
+                (refilled > rule.capacity, float(rule.capacity)), else_=refilled
+            )
+            - 1,
+            last_refill=case(
+                (RateLimitBucketOrm.last_refill < now, now),
+                else_=RateLimitBucketOrm.last_refill,
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    result = await sess.execute(stmt)
+    return result.rowcount != 0
+
+
+async def _insert_bucket(sess: AsyncSession, row: dict[str, Any]) -> bool:
+    # 插入新的令牌桶，已存在时（被其他请求抢先插入）不做任何操作并返回False
+    dialect_name = sess.get_bind(RateLimitBucketOrm).dialect.name
+    if dialect_name in ("sqlite", "postgresql"):
+        if dialect_name == "sqlite":
+            stmt = sqlite_insert(RateLimitBucketOrm)
+        else:
+            stmt = postgresql_insert(RateLimitBucketOrm)
+        stmt = stmt.values(row).on_conflict_do_nothing(
+            index_elements=[RateLimitBucketOrm.rule_id, RateLimitBucketOrm.user]
+        )
+        return (await sess.execute(stmt)).rowcount != 0
+    elif dialect_name == "mysql":
+        stmt = mysql_insert(RateLimitBucketOrm).values(row).prefix_with("IGNORE")
+        return (await sess.execute(stmt)).rowcount != 0
+    else:
+        try:
+            async with sess.begin_nested():
+                await sess.execute(insert(RateLimitBucketOrm).values(row))
+            return True
+        except IntegrityError:
+            return False
+
+
+async def _acquire_bucket_token(
+    sess: AsyncSession, rule: TokenBucketRateLimitRule, user: str, now: float
+) -> bool:
+    if await _consume_bucket_token(sess, rule, user, now):
+        return True
+
+    # 首次获取，桶是满的
+    row = {
+        "rule_id": rule.id,
+        "user": user,
+        "tokens": rule.capacity - 1,
+        "last_refill": now,
+    }
+    if await _insert_bucket(sess, row):
+        return True
+
+    # 桶已存在（令牌不足，或被其他请求抢先插入），重新尝试扣减
+    return await _consume_bucket_token(sess, rule, user, now)
+
+
+async def delete_outdated_token_rows():
+    now = datetime.utcnow()
+    batch_size = conf().access_control_rate_limit_token_purge_batch_size
+    batch_interval = conf().access_control_rate_limit_token_purge_batch_interval
+
+    rowcount = 0
+    while True:
+        # 分批删除，每批单独提交，避免长时间占用数据库写锁
+        # 由定时任务调用，使用独立的session，不与调用方共享
+        async with get_session() as session:
+            stmt = delete(RateLimitTokenOrm).execution_options(
+                synchronize_session=False
+            )
+            if batch_size > 0:
+                ids = (
+                    await session.scalars(
+                        select(RateLimitTokenOrm.id)
+                        .where(RateLimitTokenOrm.expire_time <= now)
+                        .limit(batch_size)
+                    )
+                ).all()
+                if len(ids) == 0:
+                    break
+                stmt = stmt.where(RateLimitTokenOrm.id.in_(ids))
+            else:
+                stmt = stmt.where(RateLimitTokenOrm.expire_time <= now)
+
+            result = await session.execute(stmt)
+            await session.commit()
+            rowcount += result.rowcount
+
+        if batch_size <= 0 or len(ids) < batch_size:
+            break
+        await sleep(batch_interval)
+
+    logger.debug(f"deleted {rowcount} outdated rate limit token(s)")
+
+    # 删除已补满的令牌桶（不考虑桶内剩余的令牌，保守估计补满所需的时间）
+    # limit不大于0的桶永远不会补充令牌，结果为NULL，不会被删除
+    full_after = (
+        select(
+            case(
+                (
+                    RateLimitRuleOrm.limit > 0,
+                    RateLimitRuleOrm.time_span
+                    * 1.0
+                    * func.coalesce(RateLimitRuleOrm.capacity, RateLimitRuleOrm.limit)
+                    / RateLimitRuleOrm.limit,
+                ),
+                else_=None,
+            )
+        )
+        .where(RateLimitRuleOrm.id == RateLimitBucketOrm.rule_id)
+        .scalar_subquery()
+    )
+    async with get_session() as session:
+        stmt = (
+            delete(RateLimitBucketOrm)
+            .where(RateLimitBucketOrm.last_refill + full_after <= time.time())
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(stmt)
+        await session.commit()
+
+    logger.debug(f"deleted {result.rowcount} full rate limit bucket(s)")
 
 
 @context.bind_singleton_to(IRateLimitTokenRepository)
@@ -26,24 +182,26 @@ class DataStoreTokenRepository(IRateLimitTokenRepository):
         scheduler.add_job(
             self.delete_outdated_tokens,
             IntervalTrigger(minutes=1),
-            id="delete_outdated_tokens_inmemory",
+            id="delete_outdated_tokens_datastore",
         )
 
     async def get_first_expire_token(
         self, rule: RateLimitRule, user: str
     ) -> Optional[RateLimitSingleToken]:
+        if isinstance(rule, TokenBucketRateLimitRule):
+            return await self._get_first_expire_bucket_token(rule, user)
+
         now = datetime.utcnow()
 
         async with use_ac_session() as sess:
-            stmt = (
-                select(func.min(RateLimitTokenOrm.expire_time))
-                .select_from(RateLimitTokenOrm)
-                .where(RateLimitTokenOrm.expire_time > now)
-                .scalar_subquery()
-            )
             stmt = (
                 select(RateLimitTokenOrm)
-                .where(RateLimitTokenOrm.expire_time == stmt)
+                .where(
+                    RateLimitTokenOrm.rule_id == rule.id,
+                    RateLimitTokenOrm.user == user,
+                    RateLimitTokenOrm.expire_time > now,
+                )
+                .order_by(RateLimitTokenOrm.expire_time)
                 .limit(1)
             )
             res = (await sess.execute(stmt)).scalar_one_or_none()
@@ -59,9 +217,31 @@ class DataStoreTokenRepository(IRateLimitTokenRepository):
                     res.acquire_time + rule.time_span,
                 )
 
+    async def _get_first_expire_bucket_token(
+        self, rule: TokenBucketRateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        async with use_ac_session() as sess:
+            res = await sess.get(RateLimitBucketOrm, (rule.id, user))
+            if res is None:
+                return None
+
+            now = time.time()
+            tokens = min(
+                float(rule.capacity),
+                res.tokens + max(now - res.last_refill, 0.0) * refill_rate(rule),
+            )
+            return make_first_expire_token(rule, user, tokens, now)
+
     async def acquire_token(
         self, rule: RateLimitRule, user: str
     ) -> Optional[RateLimitSingleToken]:
+        if isinstance(rule, TokenBucketRateLimitRule):
+            now = time.time()
+            async with use_ac_session() as sess:
+                ok = await _acquire_bucket_token(sess, rule, user, now)
+                await sess.commit()
+            return make_token(rule, user, now) if ok else None
+
         now = datetime.utcnow()
 
         async with use_ac_session() as sess:
@@ -93,39 +273,98 @@ class DataStoreTokenRepository(IRateLimitTokenRepository):
                 x.id, x.rule_id, x.user, acquire_time, expire_time
             )
 
-    async def retire_token(self, token: RateLimitSingleToken):
+    async def acquire_tokens(
+        self, rules: Sequence[RateLimitRule], user: str
+    ) -> AcquireTokensResult:
+        rules = list({rule.id: rule for rule in rules}.values())
+        if len(rules) == 0:
+            return AcquireTokensResult([], [])
+
+        bucket_rules = [
+            rule for rule in rules if isinstance(rule, TokenBucketRateLimitRule)
+        ]
+        rules = [
+            rule for rule in rules if not isinstance(rule, TokenBucketRateLimitRule)
+        ]
+
+        now_ts = time.time()
+        now = datetime.utcfromtimestamp(now_ts)
+
         async with use_ac_session() as sess:
-            stmt = delete(RateLimitTokenOrm).where(RateLimitTokenOrm.id == token.id)
-            await sess.execute(stmt)
+            violating = []
+            if len(rules) != 0:
+                stmt = (
+                    select(RateLimitTokenOrm.rule_id, func.count())
+                    .where(
+                        RateLimitTokenOrm.rule_id.in_([rule.id for rule in rules]),
+                        RateLimitTokenOrm.user == user,
+                        RateLimitTokenOrm.expire_time > now,
+                    )
+                    .group_by(RateLimitTokenOrm.rule_id)
+                )
+                cnt = dict((await sess.execute(stmt)).all())
+
+                violating = [
+                    rule for rule in rules if cnt.get(rule.id, 0) >= rule.limit
+                ]
+
+            # 令牌桶规则在同一事务中扣减，任一规则不满足时一并回滚
+            for rule in bucket_rules:
+                if not await _acquire_bucket_token(sess, rule, user, now_ts):
+                    violating.append(rule)
+
+            if len(violating) != 0:
+                await sess.rollback()
+                return AcquireTokensResult([], violating)
+
+            orms = [
+                RateLimitTokenOrm(
+                    rule_id=rule.id,
+                    user=user,
+                    acquire_time=now,
+                    expire_time=now + rule.time_span,
+                )
+                for rule in rules
+            ]
+            sess.add_all(orms)
+            await sess.flush()
+
+            tokens = [
+                RateLimitSingleToken(
+                    x.id, x.rule_id, x.user, x.acquire_time, x.expire_time
+                )
+                for x in orms
+            ]
+            tokens.extend(make_token(rule, user, now_ts) for rule in bucket_rules)
             await sess.commit()
 
-    async def delete_outdated_tokens(self):
-        async with use_ac_session() as session:
-            now = datetime.utcnow()
-            stmts = []
-            async for rule in await session.stream_scalars(select(RateLimitRuleOrm)):
+            return AcquireTokensResult(tokens, [])
+
+    async def retire_token(self, token: RateLimitSingleToken):
+        async with use_ac_session() as sess:
+            if token.id == BUCKET_TOKEN_ID:
+                # 超出容量的部分在下次补充时截断
                 stmt = (
-                    delete(RateLimitTokenOrm)
+                    update(RateLimitBucketOrm)
                     .where(
-                        RateLimitTokenOrm.rule_id == rule.id,
-                        RateLimitTokenOrm.expire_time <= now,
+                        RateLimitBucketOrm.rule_id == token.rule_id,
+                        RateLimitBucketOrm.user == token.user,
                     )
+                    .values(tokens=RateLimitBucketOrm.tokens + 1)
                     .execution_options(synchronize_session=False)
                 )
-                stmts.append(stmt)
-
-            rowcount = 0
-            for stmt in stmts:
-                result = await session.execute(stmt)
-                rowcount += result.rowcount
-
-            await session.commit()
+            else:
+                stmt = delete(RateLimitTokenOrm).where(RateLimitTokenOrm.id == token.id)
+            await sess.execute(stmt)
+            await sess.commit()
 
-            logger.debug(f"deleted {rowcount} outdated rate limit token(s)")
+    async def delete_outdated_tokens(self):
+        await delete_outdated_token_rows()
 
     async def clear_token(self):
         async with use_ac_session() as sess:
             stmt = delete(RateLimitTokenOrm)
             result = await sess.execute(stmt)
+            await sess.execute(delete(RateLimitBucketOrm))
             await sess.commit()
             logger.debug(f"deleted {result.rowcount} rate limit token(s)")
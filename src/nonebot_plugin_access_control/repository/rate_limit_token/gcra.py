@@ -0,0 +1,148 @@
+from nonebot import require
+from nonebot_plugin_access_control_api.context import context
+
+require("nonebot_plugin_apscheduler")
+
+import time
+from datetime import datetime
+from typing import Optional, NamedTuple
+
+from nonebot_plugin_apscheduler import scheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from nonebot_plugin_access_control_api.models.rate_limit import (
+    RateLimitRule,
+    RateLimitSingleToken,
+)
+
+from .interface import IRateLimitTokenRepository
+from ..rate_limit import TokenBucketRateLimitRule
+from .bucket import BUCKET_TOKEN_ID, InmemoryBuckets
+
+
+class StorageKey(NamedTuple):
+    rule_id: str
+    user: str
+
+
+class GCRAState:
+    # tat: 理论到达时间（Theoretical Arrival Time）
+    # interval: 每个token的发放间隔，即time_span / limit
+    __slots__ = ("tat", "interval")
+
+    def __init__(self, tat: float, interval: float):
+        self.tat = tat
+        self.interval = interval
+
+
+def _interval(rule: RateLimitRule) -> float:
+    return rule.time_span.total_seconds() / rule.limit
+
+
+def _tolerance(rule: RateLimitRule) -> float:
+    # 允许突发的时长，使得空闲时最多能连续获取limit个token
+    return rule.time_span.total_seconds() - _interval(rule)
+
+
+@context.bind_singleton_to(IRateLimitTokenRepository)
+class GCRATokenRepository(IRateLimitTokenRepository):
+    def __init__(self):
+        self.id_cnt = 0
+        self.data: dict[StorageKey, GCRAState] = {}
+        self.buckets = InmemoryBuckets()
+
+        scheduler.add_job(
+            self.delete_outdated_tokens,
+            IntervalTrigger(minutes=1),
+            id="delete_outdated_tokens_gcra",
+        )
+
+    def next_id(self) -> int:
+        self.id_cnt += 1
+        return self.id_cnt
+
+    async def get_first_expire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        if isinstance(rule, TokenBucketRateLimitRule):
+            return self.buckets.get_first_expire_token(rule, user)
+
+        # limit不大于0的规则总是拒绝，返回一个在time_span后过期的虚拟token，
+        # 使调用方总能得到下次可用时间
+        if rule.limit <= 0:
+            acquire_time = datetime.utcnow()
+            return RateLimitSingleToken(
+                0, rule.id, user, acquire_time, acquire_time + rule.time_span
+            )
+
+        key = StorageKey(rule.id, user)
+        state = self.data.get(key)
+
+        now = time.time()
+        if state is None or state.tat <= now:
+            return None
+
+        # 不保存每个token，返回一个虚拟token，其过期时间为下一个token的可用时间
+        available_time = max(state.tat - _tolerance(rule), now)
+        return RateLimitSingleToken(
+            0,
+            rule.id,
+            user,
+            datetime.utcfromtimestamp(available_time - rule.time_span.total_seconds()),
+            datetime.utcfromtimestamp(available_time),
+        )
+
+    async def acquire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        if isinstance(rule, TokenBucketRateLimitRule):
+            return self.buckets.acquire_token(rule, user)
+
+        if rule.limit <= 0:
+            return None
+
+        key = StorageKey(rule.id, user)
+        state = self.data.get(key)
+
+        now = time.time()
+        tat = max(state.tat, now) if state is not None else now
+        if tat - now > _tolerance(rule):
+            return None
+
+        interval = _interval(rule)
+        if state is None:
+            self.data[key] = GCRAState(tat + interval, interval)
+        else:
+            state.tat = tat + interval
+            state.interval = interval
+
+        acquire_time = datetime.utcfromtimestamp(now)
+        expire_time = acquire_time + rule.time_span
+        return RateLimitSingleToken(
+            self.next_id(), rule.id, user, acquire_time, expire_time
+        )
+
+    async def retire_token(self, token: RateLimitSingleToken):
+        if token.id == BUCKET_TOKEN_ID:
+            self.buckets.retire_token(token)
+            return
+
+        key = StorageKey(token.rule_id, token.user)
+        state = self.data.get(key)
+        if state is None or token.expire_time <= datetime.utcnow():
+            return
+
+        state.tat -= state.interval
+        if state.tat <= time.time():
+            del self.data[key]
+
+    async def delete_outdated_tokens(self):
+        now = time.time()
+        del_keys = [k for k, state in self.data.items() if state.tat <= now]
+        for k in del_keys:
+            del self.data[k]
+
+        self.buckets.delete_full_buckets()
+
+    async def clear_token(self):
+        self.data = {}
+        self.buckets.clear()
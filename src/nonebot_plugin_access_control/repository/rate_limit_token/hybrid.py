@@ -0,0 +1,271 @@
+import contextvars
+from typing import Optional
+from asyncio import (
+    Task,
+    Event,
+    TimeoutError,
+    CancelledError,
+    wait_for,
+    get_running_loop,
+)
+
+from loguru import logger
+from nonebot import get_driver
+from nonebot_plugin_orm import get_session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, insert, select, tuple_
+from nonebot_plugin_access_control_api.context import context
+from nonebot_plugin_access_control_api.models.rate_limit import (
+    RateLimitRule,
+    RateLimitSingleToken,
+)
+
+from ...config import conf
+from ...utils.lock import LazyLock
+from .bucket import BUCKET_TOKEN_ID, BucketKey
+from .interface import IRateLimitTokenRepository
+from .datastore import delete_outdated_token_rows
+from .inmemory import WRITE_CHUNK_SIZE, TokenRecord, InmemoryTokenRepository
+from ..orm.rate_limit import RateLimitRuleOrm, RateLimitTokenOrm, RateLimitBucketOrm
+
+
+@context.bind_singleton_to(IRateLimitTokenRepository)
+class HybridTokenRepository(InmemoryTokenRepository):
+    """
+    在内存中判定是否允许获取token，由后台任务将token的增删批量写入数据库
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        self._loaded = False
+        self._load_lock = LazyLock()
+        self._flush_lock = LazyLock()
+
+        # 待写入的token（id -> (rule_id, user, record)）与待删除的token id
+        self._pending_inserts: dict[int, tuple[str, str, TokenRecord]] = {}
+        self._pending_deletes: set[int] = set()
+        self._dirty_buckets: set[BucketKey] = set()
+
+        self._flusher: Optional[Task] = None
+        self._flush_event: Optional[Event] = None
+
+        get_driver().on_startup(self.load)
+        get_driver().on_shutdown(self.close)
+
+    async def load(self):
+        async with self._load_lock:
+            if not self._loaded:
+                await self.restore()
+                self._loaded = True
+
+    async def _ensure_loaded(self):
+        if not self._loaded:
+            await self.load()
+
+    def _ensure_flusher(self):
+        loop = get_running_loop()
+        if (
+            self._flusher is None
+            or self._flusher.done()
+            or self._flusher.get_loop() is not loop
+        ):
+            self._flush_event = Event()
+            # 在空白的上下文中启动，避免后台任务继承当前请求的session
+            self._flusher = contextvars.Context().run(
+                loop.create_task, self._run_flusher(self._flush_event)
+            )
+
+    def _pending_count(self) -> int:
+        return (
+            len(self._pending_inserts)
+            + len(self._pending_deletes)
+            + len(self._dirty_buckets)
+        )
+
+    def _notify_flusher(self):
+        self._ensure_flusher()
+        if (
+            self._pending_count()
+            >= conf().access_control_rate_limit_token_flush_batch_size
+        ):
+            self._flush_event.set()
+
+    async def _run_flusher(self, event: Event):
+        interval = conf().access_control_rate_limit_token_flush_interval
+        while True:
+            try:
+                await wait_for(event.wait(), interval)
+            except TimeoutError:
+                pass
+            event.clear()
+            await self.flush()
+
+            # 队列为空时退出，有新的写入时再启动
+            if self._pending_count() == 0:
+                break
+
+    async def flush(self):
+        async with self._flush_lock:
+            inserts, self._pending_inserts = self._pending_inserts, {}
+            deletes, self._pending_deletes = self._pending_deletes, set()
+            buckets, self._dirty_buckets = self._dirty_buckets, set()
+            if len(inserts) == 0 and len(deletes) == 0 and len(buckets) == 0:
+                return
+
+            try:
+                # 使用独立的session，不与调用方共享
+                async with get_session() as sess:
+                    # 跳过已删除的规则，否则插入会违反外键约束，且每次重试都会失败
+                    rule_ids = {x[0] for x in inserts.values()}
+                    rule_ids.update(k.rule_id for k in buckets)
+                    existing = set(
+                        (
+                            await sess.scalars(
+                                select(RateLimitRuleOrm.id).where(
+                                    RateLimitRuleOrm.id.in_(rule_ids)
+                                )
+                            )
+                        ).all()
+                    )
+                    inserts = {id: x for id, x in inserts.items() if x[0] in existing}
+                    buckets = {k for k in buckets if k.rule_id in existing}
+
+                    await self._write_pending(sess, inserts, deletes, buckets)
+                    await sess.commit()
+            except Exception as e:
+                # 写入失败时放回队列，等待下次写入
+                logger.opt(exception=e).error("failed to flush rate limit tokens")
+                for id, x in inserts.items():
+                    if id not in self._pending_deletes:
+                        self._pending_inserts.setdefault(id, x)
+                self._pending_deletes.update(deletes - inserts.keys())
+                self._dirty_buckets.update(buckets)
+                return
+
+            logger.trace(
+                f"flushed {len(inserts)} inserted, {len(deletes)} deleted "
+                f"rate limit token(s) and {len(buckets)} bucket(s)"
+            )
+
+    async def _write_pending(
+        self,
+        sess: AsyncSession,
+        inserts: dict[int, tuple[str, str, TokenRecord]],
+        deletes: set[int],
+        buckets: set[BucketKey],
+    ):
+        rows = [
+            {
+                "id": id,
+                "rule_id": rule_id,
+                "user": user,
+                "acquire_time": record.acquire_time,
+                "expire_time": record.expire_time,
+            }
+            for id, (rule_id, user, record) in inserts.items()
+        ]
+        for i in range(0, len(rows), WRITE_CHUNK_SIZE):
+            await sess.execute(
+                insert(RateLimitTokenOrm), rows[i : i + WRITE_CHUNK_SIZE]
+            )
+
+        ids = list(deletes)
+        for i in range(0, len(ids), WRITE_CHUNK_SIZE):
+            await sess.execute(
+                delete(RateLimitTokenOrm)
+                .where(RateLimitTokenOrm.id.in_(ids[i : i + WRITE_CHUNK_SIZE]))
+                .execution_options(synchronize_session=False)
+            )
+
+        # 令牌桶先删除再插入当前状态，已删除的桶不再插入
+        keys = list(buckets)
+        for i in range(0, len(keys), WRITE_CHUNK_SIZE):
+            chunk = keys[i : i + WRITE_CHUNK_SIZE]
+            await sess.execute(
+                delete(RateLimitBucketOrm)
+                .where(
+                    tuple_(RateLimitBucketOrm.rule_id, RateLimitBucketOrm.user).in_(
+                        [(k.rule_id, k.user) for k in chunk]
+                    )
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+            rows = []
+            for k in chunk:
+                state = self.buckets.data.get(k)
+                if state is not None:
+                    rows.append(
+                        {
+                            "rule_id": k.rule_id,
+                            "user": k.user,
+                            "tokens": state.tokens,
+                            "last_refill": state.last_refill,
+                        }
+                    )
+            if len(rows) != 0:
+                await sess.execute(insert(RateLimitBucketOrm), rows)
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def get_first_expire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        await self._ensure_loaded()
+        return await super().get_first_expire_token(rule, user)
+
+    async def acquire_token(
+        self, rule: RateLimitRule, user: str
+    ) -> Optional[RateLimitSingleToken]:
+        await self._ensure_loaded()
+        token = await super().acquire_token(rule, user)
+        if token is None:
+            return None
+
+        if token.id == BUCKET_TOKEN_ID:
+            self._dirty_buckets.add(BucketKey(token.rule_id, token.user))
+        else:
+            self._pending_inserts[token.id] = (
+                token.rule_id,
+                token.user,
+                TokenRecord(token.id, token.acquire_time, token.expire_time),
+            )
+        self._notify_flusher()
+        return token
+
+    async def retire_token(self, token: RateLimitSingleToken):
+        await self._ensure_loaded()
+        await super().retire_token(token)
+
+        if token.id == BUCKET_TOKEN_ID:
+            self._dirty_buckets.add(BucketKey(token.rule_id, token.user))
+        elif self._pending_inserts.pop(token.id, None) is None:
+            # 尚未写入的token直接从队列中移除
+            self._pending_deletes.add(token.id)
+        self._notify_flusher()
+
+    async def delete_outdated_tokens(self):
+        await super().delete_outdated_tokens()
+        await delete_outdated_token_rows()
+
+    async def clear_token(self):
+        async with self._flush_lock:
+            await super().clear_token()
+            self._pending_inserts = {}
+            self._pending_deletes = set()
+            self._dirty_buckets = set()
+
+            async with get_session() as sess:
+                result = await sess.execute(delete(RateLimitTokenOrm))
+                await sess.execute(delete(RateLimitBucketOrm))
+                await sess.commit()
+                logger.debug(f"deleted {result.rowcount} rate limit token(s)")
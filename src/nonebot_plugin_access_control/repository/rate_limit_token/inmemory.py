@@ -3,17 +3,35 @@ from nonebot_plugin_access_control_api.context import context
 
 require("nonebot_plugin_apscheduler")
 
+from asyncio import sleep
+from collections import deque
 from datetime import datetime
+from heapq import heappop, heappush
+from collections.abc import Iterable
 from typing import Optional, NamedTuple
 
+from loguru import logger
+from nonebot import get_driver
+from nonebot_plugin_orm import get_session
 from nonebot_plugin_apscheduler import scheduler
+from sqlalchemy import func, delete, insert, select
 from apscheduler.triggers.interval import IntervalTrigger
 from nonebot_plugin_access_control_api.models.rate_limit import (
     RateLimitRule,
     RateLimitSingleToken,
 )
 
+from ...config import conf
 from .interface import IRateLimitTokenRepository
+from ..rate_limit import TokenBucketRateLimitRule
+from .bucket import BUCKET_TOKEN_ID, BucketKey, BucketState, InmemoryBuckets
+from ..orm.rate_limit import RateLimitRuleOrm, RateLimitTokenOrm, RateLimitBucketOrm
+
+# 每清理这么多个key后让出一次事件循环
+CLEANUP_SLICE_SIZE = 1000
+
+# 批量写入数据库时每条语句包含的行数
+WRITE_CHUNK_SIZE = 500
 
 
 class StorageKey(NamedTuple):
@@ -21,18 +39,39 @@ class StorageKey(NamedTuple):
     user: str
 
 
-def _handle_expired(
-    tokens: tuple[RateLimitSingleToken, ...]
-) -> tuple[RateLimitSingleToken, ...]:
-    now = datetime.utcnow()
-    return tuple(filter(lambda x: x.expire_time > now, tokens))
+class TokenRecord:
+    __slots__ = ("id", "acquire_time", "expire_time")
+
+    def __init__(self, id: int, acquire_time: datetime, expire_time: datetime):
+        self.id = id
+        self.acquire_time = acquire_time
+        self.expire_time = expire_time
+
+    def to_token(self, key: StorageKey) -> RateLimitSingleToken:
+        return RateLimitSingleToken(
+            self.id, key.rule_id, key.user, self.acquire_time, self.expire_time
+        )
+
+
+def _handle_expired(tokens: deque[TokenRecord], now: Optional[datetime] = None):
+    # 同一key下的token属于同一规则，time_span相同，因此按获取顺序即按过期时间排列
+    if now is None:
+        now = datetime.utcnow()
+    while len(tokens) != 0 and tokens[0].expire_time <= now:
+        tokens.popleft()
 
 
 @context.bind_singleton_to(IRateLimitTokenRepository)
 class InmemoryTokenRepository(IRateLimitTokenRepository):
     def __init__(self):
         self.id_cnt = 0
-        self.data: dict[StorageKey, tuple[RateLimitSingleToken, ...]] = {}
+        self.data: dict[StorageKey, deque[TokenRecord]] = {}
+        self.buckets = InmemoryBuckets()
+
+        # 按过期时间排列的小根堆，每个key最多有一项
+        # 到期时若该key仍有未过期的token，则按其最后一个token的过期时间重新入堆
+        self._expiry: list[tuple[datetime, StorageKey]] = []
+        self._scheduled: set[StorageKey] = set()
 
         scheduler.add_job(
             self.delete_outdated_tokens,
@@ -40,60 +79,209 @@ class InmemoryTokenRepository(IRateLimitTokenRepository):
             id="delete_outdated_tokens_inmemory",
         )
 
+        # 定期及关闭时将token保存到数据库，启动时恢复未过期的token
+        if (
+            conf().access_control_rate_limit_token_storage == "inmemory"
+            and conf().access_control_rate_limit_token_snapshot_enabled
+        ):
+            get_driver().on_startup(self.restore)
+            get_driver().on_shutdown(self.snapshot)
+            scheduler.add_job(
+                self.snapshot,
+                IntervalTrigger(
+                    seconds=conf().access_control_rate_limit_token_snapshot_interval
+                ),
+                id="snapshot_tokens_inmemory",
+            )
+
     def next_id(self) -> int:
         self.id_cnt += 1
         return self.id_cnt
 
+    def load_tokens(self, tokens: Iterable[RateLimitSingleToken]):
+        # tokens须按过期时间排列，已过期的token会被忽略
+        now = datetime.utcnow()
+        for t in tokens:
+            self.id_cnt = max(self.id_cnt, t.id)
+            if t.expire_time <= now:
+                continue
+
+            key = StorageKey(t.rule_id, t.user)
+            records = self.data.get(key)
+            if records is None:
+                records = deque()
+                self.data[key] = records
+            records.append(TokenRecord(t.id, t.acquire_time, t.expire_time))
+            self._schedule_expiry(key, t.expire_time)
+
+    async def restore(self):
+        # 从数据库中恢复未过期的token与令牌桶
+        now = datetime.utcnow()
+        # 启动时、定时任务与后台任务中调用，使用独立的session，不与调用方共享
+        async with get_session() as sess:
+            max_id = await sess.scalar(select(func.max(RateLimitTokenOrm.id)))
+            self.id_cnt = max(self.id_cnt, max_id or 0)
+
+            stmt = (
+                select(RateLimitTokenOrm)
+                .where(RateLimitTokenOrm.expire_time > now)
+                .order_by(RateLimitTokenOrm.expire_time)
+            )
+            self.load_tokens(
+                [
+                    RateLimitSingleToken(
+                        x.id, x.rule_id, x.user, x.acquire_time, x.expire_time
+                    )
+                    async for x in await sess.stream_scalars(stmt)
+                ]
+            )
+
+            stmt = select(
+                RateLimitBucketOrm,
+                RateLimitRuleOrm.time_span,
+                RateLimitRuleOrm.limit,
+                func.coalesce(RateLimitRuleOrm.capacity, RateLimitRuleOrm.limit),
+            ).join(RateLimitRuleOrm)
+            async for x, time_span, limit, capacity in await sess.stream(stmt):
+                self.buckets.data[BucketKey(x.rule_id, x.user)] = BucketState(
+                    x.tokens, x.last_refill, limit / time_span, capacity
+                )
+
+    async def snapshot(self):
+        # 用内存中未过期的token与令牌桶覆盖数据库中的记录
+        now = datetime.utcnow()
+        tokens = [
+            {
+                "id": x.id,
+                "rule_id": key.rule_id,
+                "user": key.user,
+                "acquire_time": x.acquire_time,
+                "expire_time": x.expire_time,
+            }
+            for key, records in list(self.data.items())
+            for x in records
+            if x.expire_time > now
+        ]
+        buckets = [
+            {
+                "rule_id": key.rule_id,
+                "user": key.user,
+                "tokens": state.tokens,
+                "last_refill": state.last_refill,
+            }
+            for key, state in list(self.buckets.data.items())
+        ]
+
+        async with get_session() as sess:
+            # 跳过已删除的规则
+            rule_ids = set((await sess.scalars(select(RateLimitRuleOrm.id))).all())
+            tokens = [x for x in tokens if x["rule_id"] in rule_ids]
+            buckets = [x for x in buckets if x["rule_id"] in rule_ids]
+
+            await sess.execute(delete(RateLimitTokenOrm))
+            await sess.execute(delete(RateLimitBucketOrm))
+            for i in range(0, len(tokens), WRITE_CHUNK_SIZE):
+                await sess.execute(
+                    insert(RateLimitTokenOrm), tokens[i : i + WRITE_CHUNK_SIZE]
+                )
+            for i in range(0, len(buckets), WRITE_CHUNK_SIZE):
+                await sess.execute(
+                    insert(RateLimitBucketOrm), buckets[i : i + WRITE_CHUNK_SIZE]
+                )
+            await sess.commit()
+
+        logger.debug(
+            f"saved {len(tokens)} rate limit token(s) and {len(buckets)} bucket(s)"
+        )
+
     async def get_first_expire_token(
         self, rule: RateLimitRule, user: str
     ) -> Optional[RateLimitSingleToken]:
+        if isinstance(rule, TokenBucketRateLimitRule):
+            return self.buckets.get_first_expire_token(rule, user)
+
         key = StorageKey(rule.id, user)
-        tokens = _handle_expired(self.data.get(key) or ())
-        self.data[key] = tokens
-
-        with_min_expire_time = None
-        for x in tokens:
-            if (
-                with_min_expire_time is None
-                or x.expire_time < with_min_expire_time.expire_time
-            ):
-                with_min_expire_time = x
-        return with_min_expire_time
+        tokens = self.data.get(key)
+        if tokens is None:
+            return None
+
+        _handle_expired(tokens)
+        if len(tokens) == 0:
+            return None
+        return tokens[0].to_token(key)
 
     async def acquire_token(
         self, rule: RateLimitRule, user: str
     ) -> Optional[RateLimitSingleToken]:
+        if isinstance(rule, TokenBucketRateLimitRule):
+            return self.buckets.acquire_token(rule, user)
+
         key = StorageKey(rule.id, user)
-        tokens = _handle_expired(self.data.get(key) or ())
-        self.data[key] = tokens
+        tokens = self.data.get(key)
+        if tokens is None:
+            tokens = deque()
+            self.data[key] = tokens
+
+        acquire_time = datetime.utcnow()
+        _handle_expired(tokens, acquire_time)
 
         if len(tokens) >= rule.limit:
             return None
 
-        acquire_time = datetime.utcnow()
         expire_time = acquire_time + rule.time_span
 
-        token = RateLimitSingleToken(
-            self.next_id(), rule.id, user, acquire_time, expire_time
-        )
-        self.data[key] = (*tokens, token)
-        return token
+        record = TokenRecord(self.next_id(), acquire_time, expire_time)
+        tokens.append(record)
+        self._schedule_expiry(key, expire_time)
+        return record.to_token(key)
+
+    def _schedule_expiry(self, key: StorageKey, expire_time: datetime):
+        if key not in self._scheduled:
+            heappush(self._expiry, (expire_time, key))
+            self._scheduled.add(key)
 
     async def retire_token(self, token: RateLimitSingleToken):
+        if token.id == BUCKET_TOKEN_ID:
+            self.buckets.retire_token(token)
+            return
+
         key = StorageKey(token.rule_id, token.user)
-        tokens = _handle_expired(self.data.get(key) or ())
-        self.data[key] = tuple(filter(lambda x: x.id != token.id, tokens))
+        tokens = self.data.get(key)
+        if tokens is None:
+            return
+
+        _handle_expired(tokens)
+        for i, x in enumerate(tokens):
+            if x.id == token.id:
+                del tokens[i]
+                break
 
     async def delete_outdated_tokens(self):
-        del_keys = set()
+        now = datetime.utcnow()
+        cnt = 0
+
+        # 只处理到期的key，耗时与实际过期的key数量成正比
+        while len(self._expiry) != 0 and self._expiry[0][0] <= now:
+            _, key = heappop(self._expiry)
+            self._scheduled.discard(key)
+
+            tokens = self.data.get(key)
+            if tokens is not None:
+                _handle_expired(tokens, now)
+                if len(tokens) != 0:
+                    # 期间又获取了新token，按新的最后过期时间重新入堆
+                    self._schedule_expiry(key, tokens[-1].expire_time)
+                else:
+                    del self.data[key]
 
-        for k in self.data:
-            self.data[k] = _handle_expired(self.data[k])
-            if len(self.data[k]) == 0:
-                del_keys.add(k)
+            cnt += 1
+            if cnt % CLEANUP_SLICE_SIZE == 0:
+                await sleep(0)
 
-        for k in del_keys:
-            del self.data[k]
+        self.buckets.delete_full_buckets()
 
     async def clear_token(self):
         self.data = {}
+        self.buckets.clear()
+        self._expiry = []
+        self._scheduled = set()
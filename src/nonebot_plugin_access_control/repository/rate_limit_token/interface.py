@@ -1,4 +1,5 @@
-from typing import Optional, Protocol
+from collections.abc import Sequence
+from typing import Optional, Protocol, NamedTuple
 
 from nonebot_plugin_access_control_api.models.rate_limit import (
     RateLimitRule,
@@ -6,6 +7,15 @@ from nonebot_plugin_access_control_api.models.rate_limit import (
 )
 
 
+class AcquireTokensResult(NamedTuple):
+    tokens: Sequence[RateLimitSingleToken]
+    violating: Sequence[RateLimitRule]
+
+    @property
+    def success(self) -> bool:
+        return len(self.violating) == 0
+
+
 class IRateLimitTokenRepository(Protocol):
     async def get_first_expire_token(
         self, rule: RateLimitRule, user: str
@@ -17,6 +27,26 @@ class IRateLimitTokenRepository(Protocol):
     ) -> Optional[RateLimitSingleToken]:
         ...
 
+    async def acquire_tokens(
+        self, rules: Sequence[RateLimitRule], user: str
+    ) -> AcquireTokensResult:
+        # 仅当所有规则都能获取token时才获取，否则不获取任何token
+        tokens = []
+        violating = []
+        for rule in rules:
+            token = await self.acquire_token(rule, user)
+            if token is not None:
+                tokens.append(token)
+            else:
+                violating.append(rule)
+
+        if len(violating) != 0:
+            for t in tokens:
+                await self.retire_token(t)
+            tokens = []
+
+        return AcquireTokensResult(tokens, violating)
+
     async def retire_token(self, token: RateLimitSingleToken):
         ...
 
@@ -0,0 +1,41 @@
+from typing import Optional
+
+from nonebot_plugin_access_control_api.context import context
+from nonebot_plugin_access_control_api.service.interface import IService
+from nonebot_plugin_access_control_api.service.interface.nonebot_service import (
+    INoneBotService,
+)
+
+# 服务全称 -> 服务
+_index: Optional[dict[str, IService]] = None
+
+
+def _build_index() -> dict[str, IService]:
+    index = {}
+    sta: list[IService] = [context.require(INoneBotService)]
+    while len(sta) != 0:
+        node = sta.pop()
+        index[node.qualified_name] = node
+        sta.extend(node.children)
+    return index
+
+
+def get_service_by_qualified_name(qualified_name: str) -> Optional[IService]:
+    global _index
+    if _index is None:
+        _index = _build_index()
+
+    service = _index.get(qualified_name)
+    if service is None:
+        # 建立索引后才创建的服务
+        service = context.require(INoneBotService).get_service_by_qualified_name(
+            qualified_name
+        )
+        if service is not None:
+            _index[qualified_name] = service
+    return service
+
+
+def reset_service_index():
+    global _index
+    _index = None
@@ -1,4 +1,5 @@
 import contextvars
+from typing import Any, Optional
 from contextlib import AbstractAsyncContextManager, asynccontextmanager
 
 from nonebot import logger
@@ -8,18 +9,48 @@ from sqlalchemy.ext.asyncio import AsyncSession
 _ac_current_session = contextvars.ContextVar("ac_current_session")
 
 
+class LazySession:
+    # 仅在第一次实际使用时才创建AsyncSession，完全由缓存命中的请求不会创建session
+    __slots__ = ("_session", "_closed")
+
+    def __init__(self):
+        self._session: Optional[AsyncSession] = None
+        self._closed = False
+
+    @property
+    def materialized(self) -> bool:
+        return self._session is not None
+
+    def _materialize(self) -> AsyncSession:
+        if self._closed:
+            # 关闭后仍被使用，说明有任务在use_ac_session之外持有了该session
+            raise RuntimeError("ac session was used after being closed")
+        if self._session is None:
+            self._session = get_session()
+            logger.trace("sqlalchemy session was created")
+        return self._session
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._materialize(), name)
+
+    async def close(self):
+        self._closed = True
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            logger.trace("sqlalchemy session was closed")
+
+
 @asynccontextmanager
 async def use_ac_session() -> AbstractAsyncContextManager[AsyncSession]:
     try:
         yield _ac_current_session.get()
     except LookupError:
-        session = get_session()
-        logger.trace("sqlalchemy session was created")
+        session = LazySession()
         token = _ac_current_session.set(session)
 
         try:
             yield session
         finally:
             await session.close()
-            logger.trace("sqlalchemy session was closed")
             _ac_current_session.reset(token)
@@ -0,0 +1,45 @@
+from typing import Optional
+from collections.abc import Sequence
+
+from nonebot import Bot
+from nonebot.typing import T_State
+from nonebot.internal.adapter import Event
+from nonebot.message import event_preprocessor
+from nonebot_plugin_access_control_api.subject import extract_subjects
+
+STATE_KEY = "_accctrl_event_cache"
+
+
+class EventCache:
+    # 在一次事件分发中，所有事件响应器共享同一个EventCache
+    __slots__ = ("event", "subjects", "permissions")
+
+    def __init__(self, event: Event):
+        self.event = event
+        self.subjects: Optional[Sequence[str]] = None
+        # 服务全称 -> 是否允许
+        self.permissions: dict[str, bool] = {}
+
+
+@event_preprocessor
+async def _create_event_cache(event: Event, state: T_State):
+    # 各事件响应器的state为该state的浅拷贝，因此共享同一个EventCache
+    state[STATE_KEY] = EventCache(event)
+
+
+def get_event_cache(event: Event, state: T_State) -> Optional[EventCache]:
+    cache = state.get(STATE_KEY)
+    if cache is not None and cache.event is event:
+        return cache
+    return None
+
+
+def extract_subjects_cached(
+    bot: Bot, event: Event, cache: Optional[EventCache]
+) -> Sequence[str]:
+    if cache is None:
+        return extract_subjects(bot, event)
+
+    if cache.subjects is None:
+        cache.subjects = tuple(extract_subjects(bot, event))
+    return cache.subjects
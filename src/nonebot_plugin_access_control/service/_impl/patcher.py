@@ -1,6 +1,9 @@
 from functools import wraps
+from typing import Optional
 from datetime import datetime
+from collections.abc import Sequence
 
+from nonebot.typing import T_State
 from nonebot.internal.adapter import Event
 from nonebot.message import run_preprocessor
 from nonebot.exception import IgnoredException
@@ -24,7 +27,9 @@ from nonebot.internal.matcher import (
 )
 
 from ...config import conf
+from ...stats import timing
 from ...repository.utils import use_ac_session
+from .event_cache import EventCache, get_event_cache, extract_subjects_cached
 
 
 class ServicePatcherImpl(IServicePatcher):
@@ -51,6 +56,19 @@ class ServicePatcherImpl(IServicePatcher):
                 )
             await matcher.send(msg)
 
+    @staticmethod
+    async def _check_permission(
+        service: IService, subjects: Sequence[str], cache: Optional[EventCache]
+    ) -> bool:
+        if cache is None:
+            return await service.check_permission(*subjects)
+
+        allow = cache.permissions.get(service.qualified_name)
+        if allow is None:
+            allow = await service.check_permission(*subjects)
+            cache.permissions[service.qualified_name] = allow
+        return allow
+
     def patch_matcher(self, matcher: type[Matcher]) -> type[Matcher]:
         self._matcher_service_mapping[matcher] = self.service
         logger.debug(f"patched {matcher}  (with service {self.service.qualified_name})")
@@ -64,19 +82,23 @@ class ServicePatcherImpl(IServicePatcher):
                 event = current_event.get()
                 matcher = current_matcher.get()
 
+                cache = get_event_cache(event, matcher.state)
+                with timing(self.service.qualified_name, "extract"):
+                    subjects = extract_subjects_cached(bot, event, cache)
+
                 async with use_ac_session():
-                    if not await self.service.check(
-                        bot, event, acquire_rate_limit_token=False
-                    ):
-                        await self.handle_permission_denied(matcher)
+                    if not await self._check_permission(self.service, subjects, cache):
+                        with timing(self.service.qualified_name, "reply"):
+                            await self.handle_permission_denied(matcher)
                         return
 
-                    result = await self.service.acquire_token_for_rate_limit_receiving_result(
-                        bot, event
+                    result = await self.service.acquire_token_for_rate_limit_by_subjects_receiving_result(
+                        *subjects
                     )
 
                 if not result.success:
-                    await self.handle_rate_limited(matcher, result)
+                    with timing(self.service.qualified_name, "reply"):
+                        await self.handle_rate_limited(matcher, result)
                     return
 
                 t = current_rate_limit_token.set(result.token)
@@ -95,19 +117,35 @@ class ServicePatcherImpl(IServicePatcher):
 
 
 @run_preprocessor
-async def check(bot: Bot, event: Event, matcher: Matcher):
+async def check(bot: Bot, event: Event, matcher: Matcher, state: T_State):
     service = ServicePatcherImpl._matcher_service_mapping.get(type(matcher), None)
     if service is None:
         return
 
+    # 同一事件的主体只提取一次，由所有事件响应器共享
+    cache = get_event_cache(event, state)
+    with timing(service.qualified_name, "extract"):
+        subjects = extract_subjects_cached(bot, event, cache)
+
     try:
         async with use_ac_session():
-            await service.check(bot, event, throw_on_fail=True)
+            if not await ServicePatcherImpl._check_permission(service, subjects, cache):
+                raise PermissionDeniedError()
+
+            result = (
+                await service.acquire_token_for_rate_limit_by_subjects_receiving_result(
+                    *subjects
+                )
+            )
+            if not result.success:
+                raise RateLimitedError(result)
     except PermissionDeniedError:
-        await ServicePatcherImpl.handle_permission_denied(matcher)
+        with timing(service.qualified_name, "reply"):
+            await ServicePatcherImpl.handle_permission_denied(matcher)
         raise IgnoredException("permission denied (by nonebot_plugin_access_control)")
     except RateLimitedError as e:
-        await ServicePatcherImpl.handle_rate_limited(matcher, e.result)
+        with timing(service.qualified_name, "reply"):
+            await ServicePatcherImpl.handle_rate_limited(matcher, e.result)
         raise IgnoredException("rate limited (by nonebot_plugin_access_control)")
 
 
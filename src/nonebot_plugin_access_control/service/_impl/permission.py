@@ -1,5 +1,6 @@
+from asyncio import gather
 from typing import Optional
-from collections.abc import AsyncGenerator
+from collections.abc import Iterable, Sequence, AsyncGenerator
 
 from nonebot import logger
 from nonebot_plugin_access_control_api.context import context
@@ -16,13 +17,27 @@ from nonebot_plugin_access_control_api.event_bus import (
 )
 
 from ...config import conf
+from ...stats import timing
+from ...utils.lru import LRUCache
 from ...repository.utils import use_ac_session
 from ...repository.permission import IPermissionRepository
 
+T_PermissionCacheKey = tuple[str, tuple[str, ...], bool]
+
+_MISSING = object()
+
 
 class ServicePermissionImpl(IServicePermission):
     repo = context.require(IPermissionRepository)
 
+    # (服务全称, 主体, trace) -> 权限
+    # 仅能感知本进程内的权限变更，其他进程的变更需等待缓存过期
+    cache: LRUCache[T_PermissionCacheKey, Optional[Permission]] = LRUCache(
+        conf().access_control_permission_cache_size,
+        conf().access_control_permission_cache_ttl,
+    )
+    _cache_version = 0
+
     def __init__(self, service: IService):
         self.service = service
 
@@ -47,20 +62,38 @@ class ServicePermissionImpl(IServicePermission):
             func,
         )
 
+    @classmethod
+    def _invalidate_cache(cls, service: IService, subject: str):
+        # 服务的权限变更会影响其所有子服务
+        cls._cache_version += 1
+        services = {x.qualified_name for x in service.travel()}
+        cls.cache.remove_if(lambda k: k[0] in services and subject in k[1])
+
     async def get_permission_by_subject(
         self, *subject: str, trace: bool = True
     ) -> Optional[Permission]:
-        async with use_ac_session():
-            for sub in subject:
-                if trace:
-                    for node in self.service.trace():
-                        async for p in self.repo.get_permissions(node, sub):
-                            return p
-                else:
-                    async for p in self.repo.get_permissions(self.service, sub):
-                        return p
+        key = (self.service.qualified_name, subject, trace)
+        p = self.cache.get(key, _MISSING)
+        if p is not _MISSING:
+            return p
+
+        # 查询期间若发生权限变更，则不写入缓存
+        version = self._cache_version
+        p = await self._get_permission_by_subject(*subject, trace=trace)
+        if version == self._cache_version:
+            self.cache.put(key, p)
+        return p
 
-            return None
+    async def _get_permission_by_subject(
+        self, *subject: str, trace: bool = True
+    ) -> Optional[Permission]:
+        if trace:
+            services = list(self.service.trace())
+        else:
+            services = [self.service]
+
+        async with use_ac_session():
+            return await self.repo.resolve_permission(services, subject)
 
     async def get_permissions(
         self, *, trace: bool = True
@@ -92,6 +125,17 @@ class ServicePermissionImpl(IServicePermission):
             async for x in cls.repo.get_permissions(None, None):
                 yield x
 
+    @classmethod
+    async def get_permissions_page(
+        cls, subject: Optional[str], offset: int, limit: int
+    ) -> AsyncGenerator[Permission, None]:
+        # 按照服务全称、先deny再allow、主体排序，由存储完成分页
+        async with use_ac_session():
+            async for x in cls.repo.get_permissions(
+                None, subject, offset=offset, limit=limit
+            ):
+                yield x
+
     async def _fire_service_set_permission(self, subject: str, allow: bool):
         await fire_event(
             EventType.service_set_permission,
@@ -107,46 +151,88 @@ class ServicePermissionImpl(IServicePermission):
             {"service": self.service, "subject": subject},
         )
 
-    async def _fire_service_change_permission(self, subject: str, allow: bool):
-        await fire_event(
-            EventType.service_change_permission,
-            {
-                "service": self.service,
-                "permission": Permission(self.service, subject, allow),
-            },
-        )
-
-        for node in self.service.travel():
-            if node == self.service:
-                continue
-
-            cnt = 0
-            async for x in self.repo.get_permissions(node, subject):
-                cnt += 1
+    @classmethod
+    async def _fire_service_change_permissions(
+        cls, service: IService, permissions: Sequence[Permission]
+    ):
+        # 自身配置了该主体权限的子服务不受影响，一次性查出这些子服务
+        descendants = [x for x in service.travel() if x != service]
+        overridden = {
+            (x.service.qualified_name, x.subject)
+            async for x in cls.repo.get_permissions_of_services(
+                descendants, [p.subject for p in permissions]
+            )
+        }
 
-            if cnt == 0:
-                await fire_event(
+        await gather(
+            *(
+                fire_event(
                     EventType.service_change_permission,
                     {
                         "service": node,
-                        "permission": Permission(node, subject, allow),
+                        "permission": Permission(node, p.subject, p.allow),
                     },
                 )
+                for p in permissions
+                for node in [service, *descendants]
+                if (node.qualified_name, p.subject) not in overridden
+            )
+        )
+
+    async def _fire_service_change_permission(self, subject: str, allow: bool):
+        await self._fire_service_change_permissions(
+            self.service, [Permission(self.service, subject, allow)]
+        )
 
     async def set_permission(self, subject: str, allow: bool) -> bool:
         async with use_ac_session():
             ok = await self.repo.set_permission(self.service, subject, allow)
 
             if ok:
+                self._invalidate_cache(self.service, subject)
                 await self._fire_service_set_permission(subject, allow)
                 await self._fire_service_change_permission(subject, allow)
 
             return ok
 
+    @classmethod
+    async def set_permissions(
+        cls, permissions: Iterable[Permission]
+    ) -> list[Permission]:
+        async with use_ac_session():
+            changed = await cls.repo.set_permissions(permissions)
+            if len(changed) == 0:
+                return changed
+
+            # 批量变更时直接清空缓存
+            cls._cache_version += 1
+            cls.cache.clear()
+
+            # 按服务合并事件
+            changed_by_service: dict[str, list[Permission]] = {}
+            for p in changed:
+                changed_by_service.setdefault(p.service.qualified_name, []).append(p)
+
+            for permissions in changed_by_service.values():
+                service = permissions[0].service
+                await gather(
+                    *(
+                        fire_event(
+                            EventType.service_set_permission,
+                            {"service": service, "permission": p},
+                        )
+                        for p in permissions
+                    )
+                )
+                await cls._fire_service_change_permissions(service, permissions)
+
+            return changed
+
     async def remove_permission(self, subject: str) -> bool:
         async with use_ac_session():
             ok = await self.repo.remove_permission(self.service, subject)
             if ok:
+                self._invalidate_cache(self.service, subject)
                 await self._fire_service_remove_permission(subject)
 
                 p = await self.get_permission_by_subject(subject)
@@ -160,7 +246,8 @@ class ServicePermissionImpl(IServicePermission):
 
     async def check_permission(self, *subject: str) -> bool:
         async with use_ac_session():
-            p = await self.get_permission_by_subject(*subject)
+            with timing(self.service.qualified_name, "permission"):
+                p = await self.get_permission_by_subject(*subject)
             if p is not None:
                 logger.debug(
                     f"[permission] {'allowed' if p.allow else 'denied'} "
@@ -1,8 +1,9 @@
+import time
 from typing import Optional
-from datetime import timedelta
-from collections.abc import Collection, AsyncGenerator
+from datetime import datetime, timedelta
+from collections.abc import Sequence, Collection, AsyncGenerator
 
-from nonebot import logger
+from nonebot import logger, get_driver
 from nonebot_plugin_access_control_api.context import context
 from nonebot_plugin_access_control_api.service.interface import IService
 from nonebot_plugin_access_control_api.service.interface.rate_limit import (
@@ -21,9 +22,15 @@ from nonebot_plugin_access_control_api.models.rate_limit import (
     RateLimitSingleToken,
 )
 
+from ...config import conf
+from ...stats import timing
+from ...utils.lock import LazyLock
 from ...repository.utils import use_ac_session
-from ...repository.rate_limit import IRateLimitRepository
-from ...repository.rate_limit_token import IRateLimitTokenRepository
+from ...repository.rate_limit import T_RateLimitRuleKind, IRateLimitRepository
+from ...repository.rate_limit_token import (
+    AcquireTokensResult,
+    IRateLimitTokenRepository,
+)
 
 
 class RateLimitTokenImpl(IRateLimitToken):
@@ -43,6 +50,14 @@ class ServiceRateLimitImpl(IServiceRateLimit):
     repo = context.require(IRateLimitRepository)
     token_repo = context.require(IRateLimitTokenRepository)
 
+    # 服务全称 -> 主体 -> 限流规则
+    # 只能感知本进程内的规则变更，因此每隔access_control_rate_limit_rule_cache_ttl秒重新加载，
+    # 该项不大于0时不启用索引，总是查询数据库
+    _rule_index: Optional[dict[str, dict[str, list[RateLimitRule]]]] = None
+    _rule_index_loaded_at = 0.0
+    _rule_index_version = 0
+    _rule_index_lock = LazyLock()
+
     def __init__(self, service: IService):
         self.service = service
 
@@ -60,12 +75,83 @@ class ServiceRateLimitImpl(IServiceRateLimit):
             func,
         )
 
+    @classmethod
+    def _rule_index_enabled(cls) -> bool:
+        return conf().access_control_rate_limit_rule_cache_ttl > 0
+
+    @classmethod
+    def _rule_index_fresh(cls) -> bool:
+        return (
+            cls._rule_index is not None
+            and time.monotonic() - cls._rule_index_loaded_at
+            < conf().access_control_rate_limit_rule_cache_ttl
+        )
+
+    @classmethod
+    async def load_rule_index(cls) -> dict[str, dict[str, list[RateLimitRule]]]:
+        async with cls._rule_index_lock:
+            if not cls._rule_index_fresh():
+                version = cls._rule_index_version
+                loaded_at = time.monotonic()
+
+                index: dict[str, dict[str, list[RateLimitRule]]] = {}
+                async with use_ac_session():
+                    async for x in cls.repo.get_rules_by_subject(None, None):
+                        index.setdefault(x.service.qualified_name, {}).setdefault(
+                            x.subject, []
+                        ).append(x)
+
+                # 加载期间若发生规则变更，则下次再重新加载
+                if version != cls._rule_index_version:
+                    return index
+                cls._rule_index = index
+                cls._rule_index_loaded_at = loaded_at
+            return cls._rule_index
+
+    @classmethod
+    def reset_rule_index(cls):
+        cls._rule_index = None
+        cls._rule_index_version += 1
+
+    @classmethod
+    def _index_add_rule(cls, rule: RateLimitRule):
+        cls._rule_index_version += 1
+        if cls._rule_index is None:
+            return
+
+        rules = cls._rule_index.setdefault(rule.service.qualified_name, {}).setdefault(
+            rule.subject, []
+        )
+        if all(x.id != rule.id for x in rules):
+            rules.append(rule)
+
+    @classmethod
+    def _index_remove_rule(cls, rule: RateLimitRule):
+        cls._rule_index_version += 1
+        if cls._rule_index is None:
+            return
+
+        rules_by_subject = cls._rule_index.get(rule.service.qualified_name, {})
+        rules = [x for x in rules_by_subject.get(rule.subject, ()) if x.id != rule.id]
+        if len(rules) != 0:
+            rules_by_subject[rule.subject] = rules
+        else:
+            rules_by_subject.pop(rule.subject, None)
+
     @classmethod
     async def _get_rules_by_subject(
         cls, service: Optional[IService], subject: Optional[str]
     ) -> AsyncGenerator[RateLimitRule, None]:
-        async for x in cls.repo.get_rules_by_subject(service, subject):
-            yield x
+        if service is not None and subject is not None and cls._rule_index_enabled():
+            # 鉴权时只需查询索引
+            index = cls._rule_index
+            if index is None or not cls._rule_index_fresh():
+                index = await cls.load_rule_index()
+            for x in index.get(service.qualified_name, {}).get(subject, ()):
+                yield x
+        else:
+            async for x in cls.repo.get_rules_by_subject(service, subject):
+                yield x
 
     async def get_rate_limit_rules_by_subject(
         self, *subject: str, trace: bool = True
@@ -111,6 +197,17 @@ class ServiceRateLimitImpl(IServiceRateLimit):
             async for x in cls._get_rules_by_subject(None, None):
                 yield x
 
+    @classmethod
+    async def get_rate_limit_rules_page(
+        cls, subject: Optional[str], offset: int, limit: int
+    ) -> AsyncGenerator[RateLimitRule, None]:
+        # 按照服务全称、主体、规则ID排序，由存储完成分页
+        async with use_ac_session():
+            async for x in cls.repo.get_rules_by_subject(
+                None, subject, offset=offset, limit=limit
+            ):
+                yield x
+
     @staticmethod
     async def _fire_service_add_rate_limit_rule(rule: RateLimitRule):
         for node in rule.service.travel():
@@ -127,12 +224,26 @@ class ServiceRateLimitImpl(IServiceRateLimit):
             )
 
     async def add_rate_limit_rule(
-        self, subject: str, time_span: timedelta, limit: int, overwrite: bool = False
+        self,
+        subject: str,
+        time_span: timedelta,
+        limit: int,
+        overwrite: bool = False,
+        *,
+        kind: T_RateLimitRuleKind = "window",
+        capacity: Optional[int] = None,
     ) -> RateLimitRule:
         async with use_ac_session():
             rule = await self.repo.add_rate_limit_rule(
-                self.service, subject, time_span, limit, overwrite
+                self.service,
+                subject,
+                time_span,
+                limit,
+                overwrite,
+                kind=kind,
+                capacity=capacity,
             )
+            self._index_add_rule(rule)
             await self._fire_service_add_rate_limit_rule(rule)
             return rule
 
@@ -141,6 +252,7 @@ class ServiceRateLimitImpl(IServiceRateLimit):
         async with use_ac_session():
             rule = await cls.repo.remove_rate_limit_rule(rule_id)
             if rule is not None:
+                cls._index_remove_rule(rule)
                 await cls._fire_service_remove_rate_limit_rule(rule)
                 return True
             else:
@@ -153,17 +265,21 @@ class ServiceRateLimitImpl(IServiceRateLimit):
         return await cls.token_repo.get_first_expire_token(rule, user)
 
     @classmethod
-    async def _acquire_token(
-        cls, rule: RateLimitRule, user: str
-    ) -> Optional[RateLimitSingleToken]:
-        x = await cls.token_repo.acquire_token(rule, user)
-        if x is not None:
+    async def _acquire_tokens(
+        cls, rules: Sequence[RateLimitRule], user: str
+    ) -> AcquireTokensResult:
+        result = await cls.token_repo.acquire_tokens(rules, user)
+        for x in result.tokens:
             logger.trace(
                 f"[rate limit] token {x.id} acquired "
-                f"for rule {x.rule_id} by user {x.user} "
-                f"(service: {rule.service})"
+                f"for rule {x.rule_id} by user {x.user}"
             )
-        return x
+        for rule in result.violating:
+            logger.debug(
+                f"[rate limit] limit reached for rule {rule.id} "
+                f"(service: {rule.service}, subject: {rule.subject})"
+            )
+        return result
 
     @classmethod
     async def _retire_token(cls, token: RateLimitSingleToken):
@@ -180,51 +296,47 @@ class ServiceRateLimitImpl(IServiceRateLimit):
             assert len(subject) > 0, "require at least one subject"
             user = subject[0]
 
-            tokens = []
-            violating_rules = []
-
-            # 先获取所有rule，再对每个rule获取token
-            rules = [x async for x in self.get_rate_limit_rules_by_subject(*subject)]
-            for rule in rules:
-                token = await self._acquire_token(rule, user)
-                if token is not None:
-                    tokens.append(token)
-                else:
-                    logger.debug(
-                        f"[rate limit] limit reached for rule {rule.id} "
-                        f"(service: {rule.service}, subject: {rule.subject})"
-                    )
-                    violating_rules.append(rule)
+            # 先获取所有rule，再一次性对所有rule获取token
+            with timing(self.service.qualified_name, "rule"):
+                rules = [
+                    x async for x in self.get_rate_limit_rules_by_subject(*subject)
+                ]
 
-                if rule.overwrite:
-                    break
+            with timing(self.service.qualified_name, "token"):
+                result = await self._acquire_tokens(rules, user)
 
-            success = len(violating_rules) == 0
-            if not success:
-                for t in tokens:
-                    await self._retire_token(t)
+            if not result.success:
+                violating_rules = result.violating
 
-                first_expire_token = None
+                # 获取失败后令牌可能已经补充（或规则不会发放token），此时返回None
+                available_time = None
                 for rule in violating_rules:
-                    _first_expire_token = await self._get_first_expire_token(rule, user)
-                    if (
-                        first_expire_token is None
-                        or _first_expire_token.expire_time
-                        < first_expire_token.expire_time
-                    ):
-                        first_expire_token = _first_expire_token
+                    token = await self._get_first_expire_token(rule, user)
+                    if token is None:
+                        continue
+                    if available_time is None or token.expire_time < available_time:
+                        available_time = token.expire_time
+
+                if available_time is None:
+                    available_time = datetime.utcnow()
 
                 return AcquireTokenResult(
                     success=False,
                     violating=violating_rules,
-                    available_time=first_expire_token.expire_time,
+                    available_time=available_time,
                 )
             else:
                 return AcquireTokenResult(
-                    success=True, token=RateLimitTokenImpl(tokens, self)
+                    success=True, token=RateLimitTokenImpl(result.tokens, self)
                 )
 
     @classmethod
     async def clear_rate_limit_tokens(cls):
         async with use_ac_session():
             await cls.token_repo.clear_token()
+
+
+@get_driver().on_startup
+async def _load_rule_index():
+    if ServiceRateLimitImpl._rule_index_enabled():
+        await ServiceRateLimitImpl.load_rule_index()
@@ -0,0 +1,49 @@
+from time import perf_counter
+from contextlib import contextmanager
+
+from .config import conf
+from .utils.histogram import LatencyHistogram
+
+# 鉴权热路径上的各个阶段
+STAGES = {
+    "extract": "主体提取",
+    "permission": "权限查询",
+    "rule": "限流规则查询",
+    "token": "限流令牌获取",
+    "reply": "回复发送",
+}
+
+# (服务全称, 阶段) -> 直方图
+_histograms: dict[tuple[str, str], LatencyHistogram] = {}
+
+
+def stats_enabled() -> bool:
+    return conf().access_control_stats_enabled
+
+
+def record_latency(service: str, stage: str, seconds: float):
+    hist = _histograms.get((service, stage))
+    if hist is None:
+        hist = _histograms[(service, stage)] = LatencyHistogram()
+    hist.record(seconds)
+
+
+@contextmanager
+def timing(service: str, stage: str):
+    if not stats_enabled():
+        yield
+        return
+
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        record_latency(service, stage, perf_counter() - start)
+
+
+def get_latency_histograms() -> dict[tuple[str, str], LatencyHistogram]:
+    return _histograms
+
+
+def reset_latency_histograms():
+    _histograms.clear()
@@ -1,14 +1,28 @@
+from typing import Optional
 from collections.abc import Sequence
 
-from nonebot import Bot
+from nonebot import Bot, get_driver
 from nonebot.internal.adapter import Event
 from nonebot_plugin_access_control_api.subject.model import SubjectModel
 from nonebot_plugin_session import Session, SessionLevel, extract_session
 from nonebot_plugin_access_control_api.utils.superuser import is_superuser
 from nonebot_plugin_access_control_api.subject.manager import SubjectManager
 
+from ....config import conf
+from ....utils.lru import LRUCache
+
 OFFER_BY = "nonebot_plugin_access_control"
 
+T_SessionKey = tuple[
+    str, SessionLevel, Optional[str], Optional[str], Optional[str], str
+]
+
+# 同一会话提取出的主体是确定的（除了superuser主体依赖于SUPERUSERS配置）
+_cache: LRUCache[T_SessionKey, tuple[SubjectModel, ...]] = LRUCache(
+    conf().access_control_subject_cache_size
+)
+_cache_superusers: Optional[frozenset[str]] = None
+
 
 def _append_subject(
     li: list[SubjectModel],
@@ -21,6 +35,29 @@ def _append_subject(
 
 
 def extract_from_session(session: Session) -> Sequence[SubjectModel]:
+    global _cache_superusers
+
+    superusers = frozenset(get_driver().config.superusers)
+    if superusers != _cache_superusers:
+        _cache.clear()
+        _cache_superusers = superusers
+
+    key = (
+        session.platform,
+        session.level,
+        session.id1,
+        session.id2,
+        session.id3,
+        session.bot_type,
+    )
+    li = _cache.get(key)
+    if li is None:
+        li = tuple(_extract_from_session(session))
+        _cache.put(key, li)
+    return li
+
+
+def _extract_from_session(session: Session) -> list[SubjectModel]:
     if session.bot_type == "OneBot V11" or session.bot_type == "OneBot V12":
         prefix = [session.platform, "onebot"]
     else:
@@ -0,0 +1,59 @@
+from typing import Optional
+
+# 每个2的幂区间再线性划分为2**SUB_BUCKET_BITS个子桶，相对误差不超过1/16
+SUB_BUCKET_BITS = 4
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+
+def _bucket_index(value: int) -> int:
+    shift = max(value.bit_length() - SUB_BUCKET_BITS - 1, 0)
+    return shift * SUB_BUCKET_COUNT + (value >> shift)
+
+
+def _bucket_upper_bound(index: int) -> int:
+    if index < 2 * SUB_BUCKET_COUNT:
+        return index
+    shift = index // SUB_BUCKET_COUNT - 1
+    top = index - shift * SUB_BUCKET_COUNT
+    return ((top + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    HDR风格的对数分桶直方图，以微秒为单位记录耗时
+    """
+
+    def __init__(self):
+        # 桶序号 -> 计数
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds: float):
+        value = max(int(seconds * 1_000_000), 0)
+        index = _bucket_index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> Optional[float]:
+        # 返回耗时的q分位数（单位：秒）
+        if self.count == 0:
+            return None
+
+        rank = max(int(q * self.count + 0.5), 1)
+        cnt = 0
+        for index in sorted(self.buckets):
+            cnt += self.buckets[index]
+            if cnt >= rank:
+                return min(_bucket_upper_bound(index), self.max) / 1_000_000
+        return self.max / 1_000_000
+
+    @property
+    def mean(self) -> Optional[float]:
+        if self.count == 0:
+            return None
+        return self.total / self.count / 1_000_000
@@ -0,0 +1,31 @@
+from typing import Optional
+from asyncio import Lock, AbstractEventLoop, get_running_loop
+
+
+class LazyLock:
+    """
+    在首次使用时才于当前事件循环中创建的asyncio.Lock
+
+    Python 3.9的asyncio.Lock在创建时即绑定事件循环，若在导入时创建，
+    在其他事件循环中发生争用时会抛出"attached to a different loop"
+    """
+
+    def __init__(self):
+        self._lock: Optional[Lock] = None
+        self._loop: Optional[AbstractEventLoop] = None
+
+    def _get_lock(self) -> Lock:
+        loop = get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = Lock()
+            self._loop = loop
+        return self._lock
+
+    def locked(self) -> bool:
+        return self._lock is not None and self._lock.locked()
+
+    async def __aenter__(self):
+        await self._get_lock().acquire()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._lock.release()
@@ -0,0 +1,72 @@
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any, Generic, TypeVar, Callable, Optional
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        # 单位：秒，为None或不大于0时不过期
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # key -> (value, 过期时间)
+        self._data: OrderedDict[K, tuple[V, Optional[float]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._data
+
+    def get(self, key: K, default: Any = None) -> Any:
+        try:
+            value, deadline = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        if deadline is not None and deadline <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: K, value: V):
+        if self.maxsize <= 0:
+            return
+
+        deadline = None
+        if self.ttl is not None and self.ttl > 0:
+            deadline = time.monotonic() + self.ttl
+
+        self._data[key] = (value, deadline)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K, default: Any = None) -> Any:
+        x = self._data.pop(key, None)
+        if x is None:
+            return default
+        return x[0]
+
+    def remove_if(self, predicate: Callable[[K], bool]) -> int:
+        keys = [k for k in self._data if predicate(k)]
+        for k in keys:
+            del self._data[k]
+        return len(keys)
+
+    def clear(self):
+        self._data.clear()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
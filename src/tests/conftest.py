@@ -37,6 +37,7 @@ async def _init_orm(_prepare_nonebot):
     from nonebot_plugin_access_control.repository.orm.rate_limit import (
         RateLimitRuleOrm,
         RateLimitTokenOrm,
+        RateLimitBucketOrm,
     )
 
     global _orm_inited
@@ -49,4 +50,65 @@ async def _init_orm(_prepare_nonebot):
         await sess.execute(delete(PermissionOrm))
         await sess.execute(delete(RateLimitRuleOrm))
         await sess.execute(delete(RateLimitTokenOrm))
+        await sess.execute(delete(RateLimitBucketOrm))
         await sess.commit()
+
+    _clear_caches()
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def _close_token_repo(_init_orm):
+    yield
+
+    from nonebot_plugin_access_control_api.context import context
+
+    from nonebot_plugin_access_control.config import conf
+    from nonebot_plugin_access_control.repository.rate_limit_token import (
+        IRateLimitTokenRepository,
+    )
+
+    # 每个测试使用独立的事件循环，需在循环关闭前停止后台写入任务
+    if conf().access_control_rate_limit_token_storage == "hybrid":
+        await context.require(IRateLimitTokenRepository).close()
+
+
+@pytest.fixture
+def storage_class(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch, app):
+    """
+    导入并返回参数指定的存储实现类（repository包下的"模块.类名"），
+    用于在任意存储配置下直接测试该实现
+    """
+    from importlib import import_module
+
+    from nonebot_plugin_access_control_api.context import context
+
+    # 存储模块在导入时会绑定到接口，直接导入时不应替换当前使用的存储
+    monkeypatch.setattr(context, "bind_singleton_to", lambda *args: lambda cls: cls)
+
+    module_name, class_name = request.param.rsplit(".", 1)
+    module = import_module(f"nonebot_plugin_access_control.repository.{module_name}")
+    return getattr(module, class_name)
+
+
+def _clear_caches():
+    from nonebot_plugin_access_control.config import conf
+    from nonebot_plugin_access_control.service._impl.rate_limit import (
+        ServiceRateLimitImpl,
+    )
+    from nonebot_plugin_access_control.service._impl.permission import (
+        ServicePermissionImpl,
+    )
+
+    ServicePermissionImpl.cache.clear()
+    ServicePermissionImpl.cache.reset_stats()
+    ServiceRateLimitImpl.reset_rule_index()
+    ServicePermissionImpl.repo.membership.reset()
+
+    if conf().access_control_permission_storage == "inmemory":
+        from nonebot_plugin_access_control_api.context import context
+
+        from nonebot_plugin_access_control.repository.permission import (
+            IPermissionRepository,
+        )
+
+        context.require(IPermissionRepository).reset()
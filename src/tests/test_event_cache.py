@@ -0,0 +1,42 @@
+import pytest
+from nonebug import App
+
+from .utils.ob11_event import SELF_ID, fake_ob11_group_message_event
+
+
+@pytest.mark.asyncio
+async def test_subjects_shared_across_matchers(app: App):
+    from nonebot import on_command
+    from nonebot.adapters.onebot.v11 import Bot
+    from nonebot.internal.matcher import Matcher
+
+    from nonebot_plugin_ac_demo.matcher_demo import a_service, c_service
+    from nonebot_plugin_access_control.subject.extractor.builtin import session
+
+    e1_matcher = on_command("e", priority=98, block=False)
+    e2_matcher = on_command("e", priority=98, block=False)
+    a_service.patch_matcher(e1_matcher)
+    c_service.patch_matcher(e2_matcher)
+
+    @e1_matcher.handle()
+    async def _(matcher: Matcher):
+        await matcher.send("e")
+
+    @e2_matcher.handle()
+    async def _(matcher: Matcher):
+        await matcher.send("e")
+
+    session._cache.reset_stats()
+
+    async with app.test_matcher([e1_matcher, e2_matcher]) as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/e")
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, "e")
+        ctx.should_call_send(event, "e")
+
+    # 两个事件响应器只提取了一次主体
+    assert session._cache.hits + session._cache.misses == 1
+
+    e1_matcher.destroy()
+    e2_matcher.destroy()
@@ -0,0 +1,30 @@
+import asyncio
+
+
+def test_lazy_lock_across_event_loops():
+    from nonebot_plugin_access_control.utils.lock import LazyLock
+
+    lock = LazyLock()
+    order = []
+
+    async def worker(i: int):
+        async with lock:
+            order.append(i)
+            await asyncio.sleep(0.01)
+            order.append(i)
+
+    async def main():
+        await asyncio.gather(*[worker(i) for i in range(3)])
+
+    # 同一个锁在多个事件循环中发生争用
+    for _ in range(2):
+        order.clear()
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(main())
+        finally:
+            loop.close()
+
+        # 互斥：每个worker的两次记录相邻
+        assert order[0::2] == order[1::2]
+        assert not lock.locked()
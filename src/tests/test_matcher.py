@@ -0,0 +1,48 @@
+from asyncio import sleep
+
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_multipart_sender(app: App):
+    from nonebot_plugin_access_control.matcher import MultipartSender
+
+    class FakeMatcher:
+        def __init__(self):
+            self.sent = []
+
+        async def send(self, content: str):
+            self.sent.append(content)
+
+    matcher = FakeMatcher()
+    f = MultipartSender(matcher, lines_per_message=2)
+
+    f.write("a\nb")
+    f.write("\nc\n")
+    # 凑满一条消息后即发送，无需等待全部输出
+    await sleep(0)
+    assert matcher.sent == ["a\nb"]
+
+    f.write("\n\nd")
+    await f.aclose()
+    assert matcher.sent == ["a\nb", "c", "d"]
+
+
+@pytest.mark.asyncio
+async def test_multipart_sender_send_error(app: App):
+    from nonebot_plugin_access_control.matcher import MultipartSender
+
+    class FakeMatcher:
+        async def send(self, content: str):
+            raise RuntimeError("send failed")
+
+    f = MultipartSender(FakeMatcher(), lines_per_message=1)
+
+    f.write("a\n")
+    await sleep(0)
+    # 发送失败后，后续写入抛出发送时的异常
+    with pytest.raises(RuntimeError, match="send failed"):
+        f.write("b\n")
+    with pytest.raises(RuntimeError, match="send failed"):
+        await f.aclose()
@@ -1,3 +1,5 @@
+from asyncio import sleep
+
 import pytest
 from nonebug import App
 
@@ -63,3 +65,278 @@ async def test_permission(app: App):
         bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
         event = fake_ob11_group_message_event("/c")
         ctx.receive_event(bot, event)
+
+
+@pytest.mark.asyncio
+async def test_permission_cache(app: App, monkeypatch):
+    from nonebot_plugin_ac_demo.matcher_demo import group1, a_service, c_service
+    from nonebot_plugin_access_control.service._impl.permission import (
+        ServicePermissionImpl,
+    )
+
+    cache = ServicePermissionImpl.cache
+    monkeypatch.setattr(cache, "maxsize", 4096)
+
+    await group1.set_permission("qq:23456", False)
+
+    assert await a_service.check_permission("qq:23456", "qq") is False
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert await a_service.check_permission("qq:23456", "qq") is False
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert await c_service.check_permission("qq:23456", "qq") is True
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # 修改权限后，子服务的缓存失效
+    await group1.set_permission("qq:23456", True)
+    assert await a_service.check_permission("qq:23456", "qq") is True
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    # 与主体无关的缓存不受影响
+    await group1.set_permission("qq:99999", False)
+    assert await a_service.check_permission("qq:23456", "qq") is True
+    assert (cache.hits, cache.misses) == (2, 3)
+
+    await group1.remove_permission("qq:23456")
+    cache.reset_stats()
+    assert await a_service.check_permission("qq:23456", "qq") is True
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+@pytest.mark.asyncio
+async def test_resolve_permission(app: App):
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_ac_demo.matcher_demo import group1, a_service
+    from nonebot_plugin_access_control.repository.permission import (
+        IPermissionRepository,
+    )
+
+    repo = context.require(IPermissionRepository)
+    services = list(a_service.trace())
+
+    assert await repo.resolve_permission(services, ["qq:23456", "qq"]) is None
+
+    await get_nonebot_service().set_permission("qq", False)
+    await group1.set_permission("qq", True)
+
+    # 同一主体，取最深的服务
+    p = await repo.resolve_permission(services, ["qq:23456", "qq"])
+    assert (p.service, p.subject, p.allow) == (group1, "qq", True)
+
+    # 优先级更高的主体优先，即使其服务更浅
+    await get_nonebot_service().set_permission("qq:23456", False)
+    p = await repo.resolve_permission(services, ["qq:23456", "qq"])
+    assert (p.service, p.subject, p.allow) == (get_nonebot_service(), "qq:23456", False)
+
+
+@pytest.mark.asyncio
+async def test_permission_cache_ttl(app: App, monkeypatch):
+    from nonebot_plugin_ac_demo.matcher_demo import group1, a_service
+    from nonebot_plugin_access_control.service._impl.permission import (
+        ServicePermissionImpl,
+    )
+
+    cache = ServicePermissionImpl.cache
+
+    # 默认不缓存
+    assert cache.maxsize == 0
+    await a_service.check_permission("qq:23456", "qq")
+    await a_service.check_permission("qq:23456", "qq")
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    monkeypatch.setattr(cache, "maxsize", 4096)
+    monkeypatch.setattr(cache, "ttl", 0.1)
+    cache.reset_stats()
+
+    await group1.set_permission("qq:23456", False)
+    assert await a_service.check_permission("qq:23456", "qq") is False
+    assert await a_service.check_permission("qq:23456", "qq") is False
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # 过期后重新查询
+    await sleep(0.15)
+    assert await a_service.check_permission("qq:23456", "qq") is False
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+@pytest.mark.asyncio
+async def test_permission_cache_without_session(app: App, monkeypatch):
+    from nonebot_plugin_orm import get_session
+
+    from nonebot_plugin_ac_demo.matcher_demo import a_service
+    from nonebot_plugin_access_control.repository import utils
+    from nonebot_plugin_access_control.service._impl.permission import (
+        ServicePermissionImpl,
+    )
+
+    monkeypatch.setattr(ServicePermissionImpl.cache, "maxsize", 4096)
+
+    created = 0
+
+    def _get_session():
+        nonlocal created
+        created += 1
+        return get_session()
+
+    monkeypatch.setattr(utils, "get_session", _get_session)
+
+    await a_service.check_permission("qq:23456", "qq")
+    assert created == 1
+
+    # 命中缓存时不创建session
+    await a_service.check_permission("qq:23456", "qq")
+    assert created == 1
+
+
+@pytest.mark.asyncio
+async def test_permission_membership(app: App, monkeypatch):
+    from nonebot_plugin_orm import get_session
+
+    from nonebot_plugin_access_control.config import conf
+    from nonebot_plugin_access_control.repository import utils
+    from nonebot_plugin_ac_demo.matcher_demo import group1, a_service
+    from nonebot_plugin_access_control.service._impl.permission import (
+        ServicePermissionImpl,
+    )
+
+    monkeypatch.setattr(conf(), "access_control_permission_cache_size", 4096)
+
+    await group1.set_permission("qq:g1", False)
+    assert await a_service.check_permission("qq:23456", "qq:g1") is False
+
+    created = 0
+
+    def _get_session():
+        nonlocal created
+        created += 1
+        return get_session()
+
+    monkeypatch.setattr(utils, "get_session", _get_session)
+
+    # 未配置权限的服务与主体不查询数据库
+    repo = ServicePermissionImpl.repo
+    assert await repo.resolve_permission(list(a_service.trace()), ["qq:23456"]) is None
+    assert [x async for x in repo.get_permissions(a_service, "qq:g1")] == []
+    assert [x async for x in repo.get_permissions(group1, "qq:23456")] == []
+    assert created == 0
+
+    p = await repo.resolve_permission(list(a_service.trace()), ["qq:23456", "qq:g1"])
+    assert p.service == group1
+    assert p.allow is False
+
+    await group1.remove_permission("qq:g1")
+    created = 0
+    assert await repo.resolve_permission(list(a_service.trace()), ["qq:g1"]) is None
+    assert created == 0
+
+
+@pytest.mark.asyncio
+async def test_permission_written_by_other_process(app: App, monkeypatch):
+    from nonebot_plugin_orm import get_session
+
+    from nonebot_plugin_access_control.config import conf
+    from nonebot_plugin_ac_demo.matcher_demo import group1, a_service
+    from nonebot_plugin_access_control.repository.orm.permission import PermissionOrm
+    from nonebot_plugin_access_control.service._impl.permission import (
+        ServicePermissionImpl,
+    )
+
+    if conf().access_control_permission_storage != "datastore":
+        pytest.skip("only for datastore permission storage")
+
+    async def write(subject: str, allow: bool):
+        # 模拟nb accctrl或其他实例直接写入数据库
+        async with get_session() as sess:
+            sess.add(
+                PermissionOrm(
+                    service=group1.qualified_name, subject=subject, allow=allow
+                )
+            )
+            await sess.commit()
+
+    # 默认不缓存，立即生效
+    assert await a_service.check_permission("qq:10001") is True
+    await write("qq:10001", False)
+    assert await a_service.check_permission("qq:10001") is False
+
+    # 启用缓存时，过期后生效
+    monkeypatch.setattr(conf(), "access_control_permission_cache_size", 4096)
+    monkeypatch.setattr(conf(), "access_control_permission_cache_ttl", 0.1)
+    monkeypatch.setattr(ServicePermissionImpl.cache, "maxsize", 4096)
+    monkeypatch.setattr(ServicePermissionImpl.cache, "ttl", 0.1)
+
+    assert await a_service.check_permission("qq:10002") is True
+    await write("qq:10002", False)
+    assert await a_service.check_permission("qq:10002") is True
+    await sleep(0.15)
+    assert await a_service.check_permission("qq:10002") is False
+
+
+@pytest.mark.asyncio
+async def test_change_permission_event(app: App):
+    from nonebot_plugin_access_control_api.event_bus import EventType, on_event
+
+    from nonebot_plugin_ac_demo.plugin_service import plugin_service
+    from nonebot_plugin_ac_demo.matcher_demo import group1, a_service, b_service
+
+    changed = []
+
+    @on_event(EventType.service_change_permission, lambda service: True)
+    def _(service, permission):
+        if permission.subject == "qq:g12345":
+            changed.append(service)
+
+    await a_service.set_permission("qq:g12345", True)
+    changed.clear()
+
+    await plugin_service.set_permission("qq:g12345", False)
+
+    # 自身配置了权限的子服务不触发事件
+    assert plugin_service in changed
+    assert group1 in changed
+    assert b_service in changed
+    assert a_service not in changed
+    assert len(changed) == len(list(plugin_service.travel())) - 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("native_upsert", [True, False])
+async def test_set_permission_result(app: App, monkeypatch, native_upsert: bool):
+    from nonebot_plugin_access_control_api.models.permission import Permission
+
+    from nonebot_plugin_ac_demo.matcher_demo import group1
+    from nonebot_plugin_access_control.repository.permission import impl
+    from nonebot_plugin_access_control.service._impl.permission import (
+        ServicePermissionImpl,
+    )
+
+    if not native_upsert:
+        monkeypatch.setattr(impl, "_supports_on_conflict_returning", lambda d: False)
+
+    repo = ServicePermissionImpl.repo
+    assert await repo.set_permission(group1, "qq:g1", True) is True
+    assert await repo.set_permission(group1, "qq:g1", True) is False
+    assert await repo.set_permission(group1, "qq:g1", False) is True
+    assert [x async for x in repo.get_permissions(group1, "qq:g1")] == [
+        Permission(group1, "qq:g1", False)
+    ]
+
+    changed = await repo.set_permissions(
+        [Permission(group1, "qq:g1", False), Permission(group1, "qq:g2", True)]
+    )
+    assert changed == [Permission(group1, "qq:g2", True)]
+
+
+def test_on_conflict_upsert_statement():
+    from sqlalchemy.dialects import sqlite, postgresql
+
+    from nonebot_plugin_access_control.repository.permission.impl import (
+        _on_conflict_upsert,
+    )
+
+    rows = [{"service": "a", "subject": "all", "allow": True}]
+    for name, dialect in (("sqlite", sqlite), ("postgresql", postgresql)):
+        sql = str(_on_conflict_upsert(name, rows).compile(dialect=dialect.dialect()))
+        assert "ON CONFLICT (subject, service) DO UPDATE" in sql
+        assert "RETURNING" in sql
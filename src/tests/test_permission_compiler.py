@@ -0,0 +1,41 @@
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_permission_compiler(app: App):
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_ac_demo.matcher_demo import group1, a_service, c_service
+    from nonebot_plugin_access_control.repository.permission.compiler import (
+        PermissionCompiler,
+    )
+
+    nonebot_service = get_nonebot_service()
+
+    data = {
+        "nonebot": {"all": False, "qq": False},
+        "nonebot_plugin_ac_demo.group1": {"qq": True},
+    }
+    compiler = PermissionCompiler(data)
+    compiler.compile(nonebot_service)
+
+    p = compiler.resolve(a_service, ["qq:23456", "qq", "all"])
+    assert (p.service, p.subject, p.allow) == (group1, "qq", True)
+
+    p = compiler.resolve(c_service, ["qq:23456", "qq", "all"])
+    assert (p.service, p.subject, p.allow) == (nonebot_service, "qq", False)
+
+    assert compiler.resolve(a_service, ["qq:23456"]) is None
+
+    # 未配置权限的服务复用父服务的表
+    assert compiler.get_table(a_service) is compiler.get_table(group1)
+
+    # 仅重新编译受影响的子树
+    c_table = compiler.get_table(c_service)
+    data["nonebot_plugin_ac_demo.group1"]["qq:23456"] = False
+    compiler.recompile(group1)
+
+    p = compiler.resolve(a_service, ["qq:23456", "qq", "all"])
+    assert (p.service, p.subject, p.allow) == (group1, "qq:23456", False)
+    assert compiler.get_table(c_service) is c_table
@@ -83,3 +83,111 @@ async def test_permission_handler(app: App):
     with StringIO() as f:
         await ls(f, None, None)
         check_ls_res(f.getvalue(), [perm[1]], None)
+
+
+@pytest.mark.asyncio
+async def test_permission_import_export(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot_plugin_access_control_api.service import get_service_by_qualified_name
+    from nonebot_plugin_access_control_api.errors import (
+        AccessControlQueryError,
+        AccessControlBadRequestError,
+    )
+
+    from nonebot_plugin_access_control.handler import permission_handler
+    from nonebot_plugin_access_control.handler.utils.env import ac_set_script_env
+    from nonebot_plugin_access_control.handler.permission_handler import export, import_
+
+    ac_set_script_env()
+    # 使导出跨越多页
+    monkeypatch.setattr(permission_handler, "EXPORT_PAGE_SIZE", 2)
+
+    content = [
+        "allow nonebot_plugin_ac_demo qq:g1\n"
+        "deny nonebot_plugin_ac_demo.group1 qq:23456\n"
+        "deny nonebot_plugin_ac_demo.group1.a qq:g1"
+    ]
+
+    with StringIO() as f:
+        await import_(f, content)
+        assert "共3条，其中3条发生变更" in f.getvalue()
+
+    demo = get_service_by_qualified_name("nonebot_plugin_ac_demo")
+    group1 = get_service_by_qualified_name("nonebot_plugin_ac_demo.group1")
+    a = get_service_by_qualified_name("nonebot_plugin_ac_demo.group1.a")
+    assert await demo.check_permission("qq:g1") is True
+    assert await group1.check_permission("qq:23456", "qq:g1") is False
+    assert await a.check_permission("qq:g1") is False
+
+    # 再次导入时只有发生变化的权限被写入
+    with StringIO() as f:
+        await import_(f, content[0].replace("deny", "allow").split(" "))
+        assert "共3条，其中2条发生变更" in f.getvalue()
+    assert await a.check_permission("qq:g1") is True
+
+    with StringIO() as f:
+        await export(f)
+        res = f.getvalue().strip().split("\n")
+    assert sorted(res) == [
+        "allow nonebot_plugin_ac_demo qq:g1",
+        "allow nonebot_plugin_ac_demo.group1 qq:23456",
+        "allow nonebot_plugin_ac_demo.group1.a qq:g1",
+    ]
+
+    with StringIO() as f:
+        with pytest.raises(AccessControlBadRequestError):
+            await import_(f, ["allow nonebot_plugin_ac_demo"])
+        with pytest.raises(AccessControlBadRequestError):
+            await import_(f, ["permit nonebot_plugin_ac_demo qq:g1"])
+        with pytest.raises(AccessControlQueryError):
+            await import_(f, ["allow nonebot_plugin_not_exists qq:g1"])
+
+
+@pytest.mark.asyncio
+async def test_permission_handler_ls_page(app: App):
+    from nonebot_plugin_access_control_api.errors import AccessControlBadRequestError
+
+    from nonebot_plugin_access_control.handler.utils.env import ac_set_script_env
+    from nonebot_plugin_access_control.handler.permission_handler import ls, import_
+
+    ac_set_script_env()
+
+    with StringIO() as f:
+        await import_(
+            f, [f"allow nonebot_plugin_ac_demo qq:{i}" for i in range(10, 15)]
+        )
+
+    pages = []
+    for page in (1, 2, 3):
+        with StringIO() as f:
+            await ls(f, None, None, page, 2)
+            pages.append(f.getvalue().strip().split("\n"))
+
+    assert pages[0][:2] == [
+        "'nonebot_plugin_ac_demo' 允许 'qq:10'",
+        "'nonebot_plugin_ac_demo' 允许 'qq:11'",
+    ]
+    assert "使用 --page 2 --page-size 2 查看下一页" in pages[0][2]
+    assert pages[1][:2] == [
+        "'nonebot_plugin_ac_demo' 允许 'qq:12'",
+        "'nonebot_plugin_ac_demo' 允许 'qq:13'",
+    ]
+    assert pages[2] == ["'nonebot_plugin_ac_demo' 允许 'qq:14'"]
+
+    with StringIO() as f:
+        await ls(f, "nonebot_plugin_ac_demo.group1", None, 3, 2)
+        assert (
+            f.getvalue().strip()
+            == "'nonebot_plugin_ac_demo' 允许 'qq:14' (继承自服务 'nonebot_plugin_ac_demo')"
+        )
+
+    # 下一页的提示包含查询时指定的所有选项
+    with StringIO() as f:
+        await ls(f, "nonebot_plugin_ac_demo", None, 1, 2)
+        assert (
+            "使用 --srv nonebot_plugin_ac_demo --page 2 --page-size 2 查看下一页"
+            in f.getvalue()
+        )
+
+    with StringIO() as f:
+        with pytest.raises(AccessControlBadRequestError):
+            await ls(f, None, None, 0, 2)
@@ -0,0 +1,100 @@
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "storage_class",
+    ["permission.inmemory.InmemoryPermissionRepository"],
+    indirect=True,
+)
+async def test_inmemory_permission_repository(app: App, storage_class):
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+    from nonebot_plugin_access_control_api.models.permission import Permission
+
+    from nonebot_plugin_ac_demo.matcher_demo import group1, a_service, c_service
+    from nonebot_plugin_access_control.repository.permission.impl import (
+        PermissionRepository,
+    )
+
+    repo = storage_class()
+    datastore_repo = PermissionRepository()
+    nonebot_service = get_nonebot_service()
+    subjects = ["qq:23456", "qq", "all"]
+
+    assert await repo.set_permission(nonebot_service, "qq", False)
+    assert await repo.set_permission(group1, "qq", True)
+    assert not await repo.set_permission(group1, "qq", True)
+
+    # 完整路径走编译后的权限表，其余情况逐个查找，结果应与数据库实现一致
+    for services in (
+        list(a_service.trace()),
+        list(c_service.trace()),
+        [a_service, nonebot_service],
+    ):
+        p = await repo.resolve_permission(services, subjects)
+        expected = await datastore_repo.resolve_permission(services, subjects)
+        assert (p.service, p.subject, p.allow) == (
+            expected.service,
+            expected.subject,
+            expected.allow,
+        )
+
+    p = await repo.resolve_permission(list(a_service.trace()), subjects)
+    assert (p.service, p.subject, p.allow) == (group1, "qq", True)
+    p = await repo.resolve_permission(list(c_service.trace()), subjects)
+    assert (p.service, p.subject, p.allow) == (nonebot_service, "qq", False)
+    assert await repo.resolve_permission(list(a_service.trace()), ["qq:23456"]) is None
+
+    changed = await repo.set_permissions(
+        [Permission(group1, "qq:23456", False), Permission(group1, "qq", True)]
+    )
+    assert [(x.service, x.subject, x.allow) for x in changed] == [
+        (group1, "qq:23456", False)
+    ]
+    p = await repo.resolve_permission(list(a_service.trace()), subjects)
+    assert (p.service, p.subject, p.allow) == (group1, "qq:23456", False)
+
+    permissions = [x async for x in repo.get_permissions(group1, None)]
+    assert {(x.subject, x.allow) for x in permissions} == {
+        ("qq", True),
+        ("qq:23456", False),
+    }
+    page = [x async for x in repo.get_permissions(None, None, offset=1, limit=1)]
+    expected = [
+        x async for x in datastore_repo.get_permissions(None, None, offset=1, limit=1)
+    ]
+    assert [(x.service, x.subject, x.allow) for x in page] == [
+        (x.service, x.subject, x.allow) for x in expected
+    ]
+
+    assert await repo.remove_permission(group1, "qq:23456")
+    assert not await repo.remove_permission(group1, "qq:23456")
+    p = await repo.resolve_permission(list(a_service.trace()), subjects)
+    assert (p.service, p.subject, p.allow) == (group1, "qq", True)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "storage_class",
+    ["permission.inmemory.InmemoryPermissionRepository"],
+    indirect=True,
+)
+async def test_inmemory_permission_repository_reload(app: App, storage_class):
+    from nonebot_plugin_ac_demo.matcher_demo import group1, a_service
+    from nonebot_plugin_access_control.repository.permission.impl import (
+        PermissionRepository,
+    )
+
+    repo = storage_class()
+    datastore_repo = PermissionRepository()
+
+    assert await repo.resolve_permission(list(a_service.trace()), ["qq"]) is None
+
+    # 仅在重新加载后才能看到其他途径写入的权限
+    await datastore_repo.set_permission(group1, "qq", False)
+    assert await repo.resolve_permission(list(a_service.trace()), ["qq"]) is None
+
+    repo.reset()
+    p = await repo.resolve_permission(list(a_service.trace()), ["qq"])
+    assert (p.service, p.subject, p.allow) == (group1, "qq", False)
@@ -143,3 +143,167 @@ async def test_rate_limit_retire(app: App):
         event = fake_ob11_group_message_event("/d")
         ctx.receive_event(bot, event)
         ctx.should_call_send(event, "d")
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_rule_index(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot_plugin_access_control_api.service import Service
+
+    from nonebot_plugin_access_control.config import conf
+    from nonebot_plugin_ac_demo.matcher_demo import group1, a_service
+    from nonebot_plugin_access_control.service._impl.rate_limit import (
+        ServiceRateLimitImpl,
+    )
+
+    monkeypatch.setattr(conf(), "access_control_rate_limit_rule_cache_ttl", 60)
+
+    rule1 = await group1.add_rate_limit_rule("qq:23456", timedelta(seconds=1), 1)
+
+    rules = [x async for x in a_service.get_rate_limit_rules_by_subject("qq:23456")]
+    assert rules == [rule1]
+
+    # 索引加载后不再查询数据库
+    async def _get_rules_by_subject(service, subject):
+        raise AssertionError("should not query repository")
+        yield
+
+    monkeypatch.setattr(
+        ServiceRateLimitImpl.repo, "get_rules_by_subject", _get_rules_by_subject
+    )
+
+    rule2 = await a_service.add_rate_limit_rule("qq:23456", timedelta(seconds=1), 2)
+    rules = [x async for x in a_service.get_rate_limit_rules_by_subject("qq:23456")]
+    assert rules == [rule2, rule1]
+
+    await Service.remove_rate_limit_rule(rule1.id)
+    rules = [x async for x in a_service.get_rate_limit_rules_by_subject("qq:23456")]
+    assert rules == [rule2]
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_rule_written_by_other_process(
+    app: App, monkeypatch: pytest.MonkeyPatch
+):
+    from nonebot_plugin_orm import get_session
+
+    from nonebot_plugin_access_control.config import conf
+    from nonebot_plugin_ac_demo.matcher_demo import group1, a_service
+    from nonebot_plugin_access_control.repository.orm.rate_limit import RateLimitRuleOrm
+
+    async def write(subject: str):
+        # 模拟nb accctrl或其他实例直接写入数据库
+        async with get_session() as sess:
+            sess.add(
+                RateLimitRuleOrm(
+                    service=group1.qualified_name,
+                    subject=subject,
+                    time_span=1,
+                    limit=1,
+                    overwrite=False,
+                )
+            )
+            await sess.commit()
+
+    async def get_rules(subject: str):
+        return [x async for x in a_service.get_rate_limit_rules_by_subject(subject)]
+
+    # 默认不启用索引，立即生效
+    assert await get_rules("qq:10001") == []
+    await write("qq:10001")
+    assert len(await get_rules("qq:10001")) == 1
+
+    # 启用索引时，过期后生效
+    monkeypatch.setattr(conf(), "access_control_rate_limit_rule_cache_ttl", 0.1)
+
+    assert await get_rules("qq:10002") == []
+    await write("qq:10002")
+    assert await get_rules("qq:10002") == []
+    await sleep(0.15)
+    assert len(await get_rules("qq:10002")) == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_token_bucket(app: App):
+    from datetime import datetime
+
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+    from nonebot_plugin_access_control_api.service.interface.factory import (
+        IServiceComponentFactory,
+    )
+
+    from nonebot_plugin_access_control.repository.rate_limit import (
+        TokenBucketRateLimitRule,
+    )
+
+    service = get_nonebot_service()
+    impl = context.require(IServiceComponentFactory).create_rate_limit_impl(service)
+
+    # 容量为3，每秒补充2个令牌
+    rule = await impl.add_rate_limit_rule(
+        "all", timedelta(seconds=1), 2, kind="bucket", capacity=3
+    )
+    assert isinstance(rule, TokenBucketRateLimitRule)
+    assert rule.capacity == 3
+
+    rules = [x async for x in service.get_rate_limit_rules_by_subject("all")]
+    assert len(rules) == 1
+    assert isinstance(rules[0], TokenBucketRateLimitRule)
+    assert rules[0].capacity == 3
+
+    # 满桶时允许突发
+    for _ in range(3):
+        assert await service.acquire_token_for_rate_limit_by_subjects("all")
+
+    result = await service.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "all"
+    )
+    assert not result.success
+    assert result.violating == [rule]
+    wait = (result.available_time - datetime.utcnow()).total_seconds()
+    assert 0 < wait <= 0.5
+
+    # 按比例补充令牌
+    await sleep(0.55)
+    token = await service.acquire_token_for_rate_limit_by_subjects("all")
+    assert token is not None
+    assert not await service.acquire_token_for_rate_limit_by_subjects("all")
+
+    # 归还令牌
+    await token.retire()
+    assert await service.acquire_token_for_rate_limit_by_subjects("all")
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_without_first_expire_token(
+    app: App, monkeypatch: pytest.MonkeyPatch
+):
+    from datetime import datetime
+
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.service._impl.rate_limit import (
+        ServiceRateLimitImpl,
+    )
+
+    service = get_nonebot_service()
+    rule = await service.add_rate_limit_rule("all", timedelta(seconds=60), 1)
+    assert await service.acquire_token_for_rate_limit_by_subjects("all")
+
+    # 获取失败后令牌桶可能已补充、或规则不发放token，此时存储不返回token
+    async def _get_first_expire_token(cls, rule, user):
+        return None
+
+    monkeypatch.setattr(
+        ServiceRateLimitImpl,
+        "_get_first_expire_token",
+        classmethod(_get_first_expire_token),
+    )
+
+    before = datetime.utcnow()
+    result = await service.acquire_token_for_rate_limit_by_subjects_receiving_result(
+        "all"
+    )
+    assert not result.success
+    assert result.violating == [rule]
+    assert before <= result.available_time <= datetime.utcnow()
@@ -0,0 +1,594 @@
+from asyncio import sleep
+from datetime import timedelta
+
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_inmemory_delete_outdated_tokens(app: App):
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+    from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
+
+    from nonebot_plugin_access_control.config import conf
+    from nonebot_plugin_access_control.repository.rate_limit_token import (
+        IRateLimitTokenRepository,
+    )
+
+    if conf().access_control_rate_limit_token_storage != "inmemory":
+        pytest.skip("only for inmemory rate_limit_token storage")
+
+    repo = context.require(IRateLimitTokenRepository)
+    await repo.clear_token()
+
+    service = get_nonebot_service()
+    short_rule = RateLimitRule(
+        "short", service, "all", timedelta(seconds=0.2), 2, False
+    )
+    long_rule = RateLimitRule("long", service, "all", timedelta(seconds=60), 2, False)
+
+    for user in ("u1", "u2"):
+        assert await repo.acquire_token(short_rule, user) is not None
+        assert await repo.acquire_token(long_rule, user) is not None
+    assert len(repo.data) == 4
+
+    await sleep(0.3)
+    await repo.delete_outdated_tokens()
+
+    assert {k.rule_id for k in repo.data} == {"long"}
+    assert len(repo._expiry) == 2
+
+    # 过期后重新获取的key会被重新调度
+    assert await repo.acquire_token(short_rule, "u1") is not None
+    assert await repo.acquire_token(short_rule, "u1") is not None
+    assert await repo.acquire_token(short_rule, "u1") is None
+    assert len(repo._expiry) == 3
+
+    await repo.clear_token()
+
+
+@pytest.mark.asyncio
+async def test_datastore_delete_outdated_tokens(app: App, monkeypatch):
+    from sqlalchemy import func, select
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.config import conf
+    from nonebot_plugin_access_control.repository.utils import use_ac_session
+    from nonebot_plugin_access_control.repository.rate_limit import IRateLimitRepository
+    from nonebot_plugin_access_control.repository.rate_limit_token import (
+        IRateLimitTokenRepository,
+    )
+    from nonebot_plugin_access_control.repository.orm.rate_limit import (
+        RateLimitTokenOrm,
+        RateLimitBucketOrm,
+    )
+
+    if conf().access_control_rate_limit_token_storage != "datastore":
+        pytest.skip("only for datastore rate_limit_token storage")
+
+    monkeypatch.setattr(conf(), "access_control_rate_limit_token_purge_batch_size", 2)
+    monkeypatch.setattr(
+        conf(), "access_control_rate_limit_token_purge_batch_interval", 0
+    )
+
+    repo = context.require(IRateLimitTokenRepository)
+    service = get_nonebot_service()
+    short_rule = await service.add_rate_limit_rule("all", timedelta(seconds=0.2), 10)
+    long_rule = await service.add_rate_limit_rule("qq", timedelta(seconds=60), 10)
+    # 0.1秒补满
+    short_bucket_rule = await context.require(IRateLimitRepository).add_rate_limit_rule(
+        service, "all", timedelta(seconds=1), 10, kind="bucket", capacity=1
+    )
+    long_bucket_rule = await context.require(IRateLimitRepository).add_rate_limit_rule(
+        service, "qq", timedelta(seconds=60), 1, kind="bucket", capacity=1
+    )
+
+    # limit为0的桶永远不会补满
+    zero_bucket_rule = await context.require(IRateLimitRepository).add_rate_limit_rule(
+        service, "qq", timedelta(seconds=1), 0, kind="bucket", capacity=1
+    )
+
+    for user in ("u1", "u2", "u3"):
+        assert await repo.acquire_token(short_rule, user) is not None
+        assert await repo.acquire_token(long_rule, user) is not None
+        assert await repo.acquire_token(short_bucket_rule, user) is not None
+        assert await repo.acquire_token(long_bucket_rule, user) is not None
+
+    async with use_ac_session() as sess:
+        sess.add(
+            RateLimitBucketOrm(
+                rule_id=zero_bucket_rule.id, user="u1", tokens=0, last_refill=0
+            )
+        )
+        await sess.commit()
+
+    await sleep(0.3)
+    await repo.delete_outdated_tokens()
+
+    async with use_ac_session() as sess:
+        rule_ids = (await sess.scalars(select(RateLimitTokenOrm.rule_id))).all()
+        assert set(rule_ids) == {long_rule.id}
+        assert (await sess.scalar(select(func.count(RateLimitTokenOrm.id)))) == 3
+
+        rule_ids = (await sess.scalars(select(RateLimitBucketOrm.rule_id))).all()
+        assert sorted(rule_ids) == sorted(
+            [long_bucket_rule.id] * 3 + [zero_bucket_rule.id]
+        )
+
+
+@pytest.mark.asyncio
+async def test_hybrid_write_behind(app: App):
+    from sqlalchemy import select
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.config import conf
+    from nonebot_plugin_access_control.repository.utils import use_ac_session
+    from nonebot_plugin_access_control.repository.rate_limit import IRateLimitRepository
+    from nonebot_plugin_access_control.repository.rate_limit_token import (
+        IRateLimitTokenRepository,
+    )
+    from nonebot_plugin_access_control.repository.orm.rate_limit import (
+        RateLimitTokenOrm,
+        RateLimitBucketOrm,
+    )
+
+    if conf().access_control_rate_limit_token_storage != "hybrid":
+        pytest.skip("only for hybrid rate_limit_token storage")
+
+    repo = context.require(IRateLimitTokenRepository)
+    await repo.clear_token()
+
+    service = get_nonebot_service()
+    rule = await service.add_rate_limit_rule("all", timedelta(seconds=60), 2)
+    bucket_rule = await context.require(IRateLimitRepository).add_rate_limit_rule(
+        service, "all", timedelta(seconds=60), 1, kind="bucket", capacity=2
+    )
+
+    t1 = await repo.acquire_token(rule, "u1")
+    t2 = await repo.acquire_token(rule, "u1")
+    assert t1 is not None
+    assert t2 is not None
+    assert await repo.acquire_token(rule, "u1") is None
+    assert await repo.acquire_token(bucket_rule, "u1") is not None
+
+    await repo.flush()
+    async with use_ac_session() as sess:
+        ids = (await sess.scalars(select(RateLimitTokenOrm.id))).all()
+        assert set(ids) == {t1.id, t2.id}
+        bucket = await sess.get(RateLimitBucketOrm, (bucket_rule.id, "u1"))
+        assert bucket is not None
+        assert 0.9 < bucket.tokens < 1.1
+
+    await repo.retire_token(t1)
+    await repo.flush()
+    async with use_ac_session() as sess:
+        ids = (await sess.scalars(select(RateLimitTokenOrm.id))).all()
+        assert ids == [t2.id]
+
+    # 模拟重启：清空内存状态后从数据库恢复
+    repo.id_cnt = 0
+    repo.data = {}
+    repo._expiry = []
+    repo._scheduled = set()
+    repo.buckets.clear()
+    repo._loaded = False
+
+    t3 = await repo.acquire_token(rule, "u1")
+    assert t3 is not None
+    assert t3.id > t2.id
+    assert await repo.acquire_token(rule, "u1") is None
+
+    assert await repo.acquire_token(bucket_rule, "u1") is not None
+    assert await repo.acquire_token(bucket_rule, "u1") is None
+
+    await repo.clear_token()
+
+
+@pytest.mark.asyncio
+async def test_inmemory_snapshot(app: App):
+    from sqlalchemy import select
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.config import conf
+    from nonebot_plugin_access_control.repository.utils import use_ac_session
+    from nonebot_plugin_access_control.repository.rate_limit import IRateLimitRepository
+    from nonebot_plugin_access_control.repository.orm.rate_limit import (
+        RateLimitTokenOrm,
+    )
+    from nonebot_plugin_access_control.repository.rate_limit_token import (
+        IRateLimitTokenRepository,
+    )
+
+    if conf().access_control_rate_limit_token_storage != "inmemory":
+        pytest.skip("only for inmemory rate_limit_token storage")
+
+    repo = context.require(IRateLimitTokenRepository)
+    await repo.clear_token()
+
+    service = get_nonebot_service()
+    short_rule = await service.add_rate_limit_rule("all", timedelta(seconds=1), 2)
+    long_rule = await service.add_rate_limit_rule("qq", timedelta(seconds=60), 2)
+    bucket_rule = await context.require(IRateLimitRepository).add_rate_limit_rule(
+        service, "all", timedelta(seconds=60), 1, kind="bucket", capacity=2
+    )
+
+    assert await repo.acquire_token(short_rule, "u1") is not None
+    t = await repo.acquire_token(long_rule, "u1")
+    assert t is not None
+    assert await repo.acquire_token(bucket_rule, "u1") is not None
+
+    await repo.snapshot()
+    async with use_ac_session() as sess:
+        ids = (await sess.scalars(select(RateLimitTokenOrm.id))).all()
+        assert len(ids) == 2
+
+    # 模拟重启：清空内存状态后从数据库恢复，已过期的token不会被恢复
+    await sleep(1)
+    await repo.clear_token()
+    repo.id_cnt = 0
+    await repo.restore()
+
+    assert len(repo.data) == 1
+    assert repo.id_cnt >= t.id
+    assert (await repo.get_first_expire_token(long_rule, "u1")).id == t.id
+
+    assert await repo.acquire_token(long_rule, "u1") is not None
+    assert await repo.acquire_token(long_rule, "u1") is None
+    assert await repo.acquire_token(bucket_rule, "u1") is not None
+    assert await repo.acquire_token(bucket_rule, "u1") is None
+
+    await repo.clear_token()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "storage_class", ["rate_limit_token.hybrid.HybridTokenRepository"], indirect=True
+)
+async def test_hybrid_flusher_session(
+    app: App, monkeypatch: pytest.MonkeyPatch, storage_class
+):
+    from sqlalchemy import select
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.config import conf
+    from nonebot_plugin_access_control.repository.orm.rate_limit import (
+        RateLimitTokenOrm,
+    )
+    from nonebot_plugin_access_control.repository.utils import (
+        use_ac_session,
+        _ac_current_session,
+    )
+
+    monkeypatch.setattr(conf(), "access_control_rate_limit_token_flush_interval", 0)
+
+    repo = storage_class()
+    rule = await get_nonebot_service().add_rate_limit_rule(
+        "all", timedelta(seconds=60), 2
+    )
+
+    sessions = []
+    flush = repo.flush
+
+    async def _flush():
+        sessions.append(_ac_current_session.get(None))
+        await flush()
+
+    monkeypatch.setattr(repo, "flush", _flush)
+
+    # 后台写入任务不应使用（请求结束后已关闭的）调用方session
+    async with use_ac_session() as caller_sess:
+        t1 = await repo.acquire_token(rule, "u1")
+        t2 = await repo.acquire_token(rule, "u1")
+    assert not caller_sess.materialized
+
+    await sleep(0.1)
+    assert len(sessions) != 0
+    assert all(x is None for x in sessions)
+
+    async with use_ac_session() as sess:
+        ids = (await sess.scalars(select(RateLimitTokenOrm.id))).all()
+        assert set(ids) == {t1.id, t2.id}
+
+    await repo.close()
+    await repo.clear_token()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "storage_class", ["rate_limit_token.hybrid.HybridTokenRepository"], indirect=True
+)
+async def test_hybrid_flush_removed_rule(
+    app: App, monkeypatch: pytest.MonkeyPatch, storage_class
+):
+    from sqlalchemy import select
+    from nonebot_plugin_orm import get_session
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.config import conf
+    from nonebot_plugin_access_control.repository.rate_limit import IRateLimitRepository
+    from nonebot_plugin_access_control.repository.orm.rate_limit import (
+        RateLimitTokenOrm,
+        RateLimitBucketOrm,
+    )
+
+    # 由测试手动写入
+    monkeypatch.setattr(conf(), "access_control_rate_limit_token_flush_interval", 60)
+
+    repo = storage_class()
+    rule_repo = context.require(IRateLimitRepository)
+    service = get_nonebot_service()
+    rule = await rule_repo.add_rate_limit_rule(service, "all", timedelta(seconds=60), 2)
+    removed_rule = await rule_repo.add_rate_limit_rule(
+        service, "qq", timedelta(seconds=60), 2
+    )
+    removed_bucket_rule = await rule_repo.add_rate_limit_rule(
+        service, "all", timedelta(seconds=60), 1, kind="bucket", capacity=2
+    )
+
+    t = await repo.acquire_token(rule, "u1")
+    assert await repo.acquire_token(removed_rule, "u1") is not None
+    assert await repo.acquire_token(removed_bucket_rule, "u1") is not None
+
+    # 写入前删除规则，其token与令牌桶不再写入，也不放回队列
+    await rule_repo.remove_rate_limit_rule(removed_rule.id)
+    await rule_repo.remove_rate_limit_rule(removed_bucket_rule.id)
+    await repo.flush()
+    assert repo._pending_count() == 0
+
+    async with get_session() as sess:
+        ids = (await sess.scalars(select(RateLimitTokenOrm.id))).all()
+        assert ids == [t.id]
+        buckets = (await sess.scalars(select(RateLimitBucketOrm.rule_id))).all()
+        assert buckets == []
+
+    await repo.close()
+    await repo.clear_token()
+
+
+@pytest.mark.asyncio
+async def test_inmemory_snapshot_session(app: App):
+    from sqlalchemy import delete, select
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.repository.utils import use_ac_session
+    from nonebot_plugin_access_control.repository.orm.rate_limit import (
+        RateLimitTokenOrm,
+    )
+    from nonebot_plugin_access_control.repository.rate_limit_token.inmemory import (
+        InmemoryTokenRepository,
+    )
+
+    repo = InmemoryTokenRepository()
+    rule = await get_nonebot_service().add_rate_limit_rule(
+        "all", timedelta(seconds=60), 2
+    )
+    t = await repo.acquire_token(rule, "u1")
+
+    # 快照与恢复使用独立的session，不使用也不提交调用方session
+    async with use_ac_session() as caller_sess:
+        await repo.snapshot()
+        await repo.clear_token()
+        await repo.restore()
+        assert not caller_sess.materialized
+
+    assert (await repo.get_first_expire_token(rule, "u1")).id == t.id
+    async with use_ac_session() as sess:
+        ids = (await sess.scalars(select(RateLimitTokenOrm.id))).all()
+        assert ids == [t.id]
+        await sess.execute(delete(RateLimitTokenOrm))
+        await sess.commit()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "storage_class", ["rate_limit_token.gcra.GCRATokenRepository"], indirect=True
+)
+async def test_gcra(app: App, storage_class):
+    from datetime import datetime
+
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+    from nonebot_plugin_access_control_api.models.rate_limit import RateLimitRule
+
+    repo = storage_class()
+
+    service = get_nonebot_service()
+    rule = RateLimitRule("rule", service, "all", timedelta(seconds=60), 2, False)
+
+    # 空闲时允许突发limit次，之后拒绝
+    t1 = await repo.acquire_token(rule, "u1")
+    t2 = await repo.acquire_token(rule, "u1")
+    assert t1 is not None
+    assert t2 is not None
+    assert await repo.acquire_token(rule, "u1") is None
+    assert await repo.acquire_token(rule, "u2") is not None
+
+    # 下一个token的可用时间为time_span / limit之后
+    first = await repo.get_first_expire_token(rule, "u1")
+    wait = (first.expire_time - datetime.utcnow()).total_seconds()
+    assert 29 < wait <= 30
+
+    # 归还token后可再次获取
+    await repo.retire_token(t2)
+    assert await repo.acquire_token(rule, "u1") is not None
+    assert await repo.acquire_token(rule, "u1") is None
+
+    # 按发放间隔恢复
+    short_rule = RateLimitRule(
+        "short", service, "all", timedelta(seconds=0.2), 2, False
+    )
+    assert await repo.acquire_token(short_rule, "u1") is not None
+    assert await repo.acquire_token(short_rule, "u1") is not None
+    assert await repo.acquire_token(short_rule, "u1") is None
+    await sleep(0.11)
+    assert await repo.acquire_token(short_rule, "u1") is not None
+    assert await repo.acquire_token(short_rule, "u1") is None
+
+    await sleep(0.2)
+    await repo.delete_outdated_tokens()
+    assert {k.rule_id for k in repo.data} == {"rule"}
+
+    # limit为0的规则总是拒绝
+    zero_rule = RateLimitRule("zero", service, "all", timedelta(seconds=60), 0, False)
+    assert await repo.acquire_token(zero_rule, "u1") is None
+    first = await repo.get_first_expire_token(zero_rule, "u1")
+    wait = (first.expire_time - datetime.utcnow()).total_seconds()
+    assert 59 < wait <= 60
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "storage_class",
+    ["rate_limit_token.datastore.DataStoreTokenRepository"],
+    indirect=True,
+)
+async def test_datastore_acquire_bucket_token(app: App, storage_class):
+    import sys
+    import time
+
+    from sqlalchemy import delete
+    from nonebot_plugin_orm import get_session
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.repository.rate_limit import IRateLimitRepository
+    from nonebot_plugin_access_control.repository.orm.rate_limit import (
+        RateLimitBucketOrm,
+    )
+
+    datastore = sys.modules[storage_class.__module__]
+    _insert_bucket = datastore._insert_bucket
+    _acquire_bucket_token = datastore._acquire_bucket_token
+
+    rule = await context.require(IRateLimitRepository).add_rate_limit_rule(
+        get_nonebot_service(),
+        "all",
+        timedelta(seconds=60),
+        1,
+        kind="bucket",
+        capacity=2,
+    )
+
+    async def put_bucket(tokens: float, last_refill: float):
+        async with get_session() as sess:
+            await sess.execute(delete(RateLimitBucketOrm))
+            sess.add(
+                RateLimitBucketOrm(
+                    rule_id=rule.id, user="u1", tokens=tokens, last_refill=last_refill
+                )
+            )
+            await sess.commit()
+
+    async def acquire() -> bool:
+        async with get_session() as sess:
+            ok = await _acquire_bucket_token(sess, rule, "u1", time.time())
+            await sess.commit()
+            return ok
+
+    # 首次获取时插入满桶
+    assert await acquire()
+    assert await acquire()
+    assert not await acquire()
+
+    # 桶已存在但令牌不足（或被其他请求抢先插入）时，不应因插入冲突而报错
+    await put_bucket(0, time.time())
+    assert not await acquire()
+    async with get_session() as sess:
+        row = {"rule_id": rule.id, "user": "u1", "tokens": 1, "last_refill": 0}
+        assert not await _insert_bucket(sess, row)
+        await sess.commit()
+
+    # 其他进程的时钟较快时，经过的时间按0计算，令牌数不会被扣成负数
+    await put_bucket(1.5, time.time() + 100)
+    assert await acquire()
+    async with get_session() as sess:
+        bucket = await sess.get(RateLimitBucketOrm, (rule.id, "u1"))
+        assert 0.4 < bucket.tokens < 0.6
+        assert bucket.last_refill > time.time() + 90
+        await sess.execute(delete(RateLimitBucketOrm))
+        await sess.commit()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "storage_class",
+    ["rate_limit_token.datastore.DataStoreTokenRepository"],
+    indirect=True,
+)
+async def test_datastore_get_first_expire_token(app: App, storage_class):
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    repo = storage_class()
+    rule = await get_nonebot_service().add_rate_limit_rule(
+        "all", timedelta(seconds=60), 2
+    )
+
+    # 其他用户更早过期的token不应被返回
+    t2 = await repo.acquire_token(rule, "u2")
+    await sleep(0.01)
+    t1 = await repo.acquire_token(rule, "u1")
+    assert t2.expire_time < t1.expire_time
+
+    first = await repo.get_first_expire_token(rule, "u1")
+    assert (first.id, first.user) == (t1.id, "u1")
+    assert await repo.get_first_expire_token(rule, "u3") is None
+
+    await repo.clear_token()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "storage_class",
+    ["rate_limit_token.datastore.DataStoreTokenRepository"],
+    indirect=True,
+)
+async def test_datastore_acquire_tokens(app: App, storage_class):
+    from sqlalchemy import func, select
+    from nonebot_plugin_orm import get_session
+    from nonebot_plugin_access_control_api.context import context
+    from nonebot_plugin_access_control_api.service import get_nonebot_service
+
+    from nonebot_plugin_access_control.repository.rate_limit import IRateLimitRepository
+    from nonebot_plugin_access_control.repository.orm.rate_limit import (
+        RateLimitTokenOrm,
+    )
+
+    repo = storage_class()
+    service = get_nonebot_service()
+    rule = await service.add_rate_limit_rule("all", timedelta(seconds=60), 1)
+    bucket_rule = await context.require(IRateLimitRepository).add_rate_limit_rule(
+        service, "all", timedelta(seconds=60), 1, kind="bucket", capacity=1
+    )
+
+    async def count_tokens() -> int:
+        async with get_session() as sess:
+            return await sess.scalar(select(func.count(RateLimitTokenOrm.id)))
+
+    # 重复的规则只获取一次
+    result = await repo.acquire_tokens([rule, bucket_rule, rule], "u1")
+    assert result.success
+    assert sorted(x.rule_id for x in result.tokens) == sorted([rule.id, bucket_rule.id])
+    assert await count_tokens() == 1
+
+    # 任一规则不满足时一并回滚，不获取任何token
+    result = await repo.acquire_tokens([rule, bucket_rule], "u1")
+    assert not result.success
+    assert {x.id for x in result.violating} == {rule.id, bucket_rule.id}
+    assert await count_tokens() == 1
+
+    # 令牌桶扣减成功但窗口规则不满足时，令牌桶的扣减也被回滚
+    other_bucket_rule = await context.require(IRateLimitRepository).add_rate_limit_rule(
+        service, "all", timedelta(seconds=60), 1, kind="bucket", capacity=1
+    )
+    result = await repo.acquire_tokens([other_bucket_rule, rule], "u1")
+    assert [x.id for x in result.violating] == [rule.id]
+    assert await repo.acquire_token(other_bucket_rule, "u1") is not None
+    assert await count_tokens() == 1
+
+    assert (await repo.acquire_tokens([], "u1")).success
+
+    await repo.clear_token()
@@ -0,0 +1,22 @@
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_service_index(app: App):
+    from nonebot_plugin_ac_demo.plugin_service import plugin_service
+    from nonebot_plugin_ac_demo.matcher_demo import group1, a_service
+    from nonebot_plugin_access_control.repository import service_index
+
+    service_index.reset_service_index()
+
+    get = service_index.get_service_by_qualified_name
+    assert get("nonebot_plugin_ac_demo") is plugin_service
+    assert get("nonebot_plugin_ac_demo.group1") is group1
+    assert get("nonebot_plugin_ac_demo.group1.a") is a_service
+    assert get("nonebot_plugin_ac_demo.not_exists") is None
+
+    # 索引中不存在时（如建立索引后才创建的服务）从服务树查找并加入索引
+    del service_index._index["nonebot_plugin_ac_demo.group1.a"]
+    assert get("nonebot_plugin_ac_demo.group1.a") is a_service
+    assert service_index._index["nonebot_plugin_ac_demo.group1.a"] is a_service
@@ -0,0 +1,25 @@
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_lazy_session(app: App):
+    from sqlalchemy import text
+
+    from nonebot_plugin_access_control.repository.utils import use_ac_session
+
+    async with use_ac_session() as sess:
+        # 未实际使用时不创建session
+        assert not sess.materialized
+
+        async with use_ac_session() as inner:
+            assert inner is sess
+
+        await sess.execute(text("SELECT 1"))
+        assert sess.materialized
+
+    assert not sess.materialized
+
+    # 关闭后不允许再次使用
+    with pytest.raises(RuntimeError):
+        await sess.execute(text("SELECT 1"))
@@ -0,0 +1,67 @@
+from io import StringIO
+
+import pytest
+from nonebug import App
+
+from .utils.ob11_event import SELF_ID, fake_ob11_group_message_event
+
+
+def test_latency_histogram():
+    from nonebot_plugin_access_control.utils.histogram import LatencyHistogram
+
+    hist = LatencyHistogram()
+    assert hist.percentile(0.5) is None
+
+    for i in range(1, 1001):
+        hist.record(i / 1000)
+
+    assert hist.count == 1000
+    # 相对误差不超过1/16
+    assert abs(hist.percentile(0.5) - 0.5) <= 0.5 / 16
+    assert abs(hist.percentile(0.99) - 0.99) <= 0.99 / 16
+    assert hist.percentile(1.0) == 1.0
+
+
+@pytest.mark.asyncio
+async def test_stats(app: App, monkeypatch: pytest.MonkeyPatch):
+    from nonebot.adapters.onebot.v11 import Bot
+
+    from nonebot_plugin_access_control.config import conf
+    from nonebot_plugin_ac_demo.matcher_demo import a_matcher
+    from nonebot_plugin_access_control.handler.stats_handler import ls, reset
+    from nonebot_plugin_access_control.handler.utils.env import ac_set_script_env
+    from nonebot_plugin_access_control.stats import (
+        STAGES,
+        get_latency_histograms,
+        reset_latency_histograms,
+    )
+
+    ac_set_script_env()
+
+    with StringIO() as f:
+        await ls(f, None)
+        assert "未启用" in f.getvalue()
+
+    monkeypatch.setattr(conf(), "access_control_stats_enabled", True)
+    reset_latency_histograms()
+
+    async with app.test_matcher(a_matcher) as ctx:
+        bot = ctx.create_bot(base=Bot, self_id=str(SELF_ID))
+        event = fake_ob11_group_message_event("/a")
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, "a")
+
+    histograms = get_latency_histograms()
+    service_name = "nonebot_plugin_ac_demo.group1.a"
+    for stage in ("extract", "permission", "rule", "token"):
+        assert histograms[(service_name, stage)].count == 1
+
+    with StringIO() as f:
+        await ls(f, service_name)
+        res = f.getvalue()
+    assert f"服务 '{service_name}'" in res
+    assert STAGES["permission"] in res
+
+    with StringIO() as f:
+        await reset(f)
+    assert len(get_latency_histograms()) == 0
@@ -0,0 +1,54 @@
+import pytest
+from nonebug import App
+
+
+@pytest.mark.asyncio
+async def test_extract_from_session_cache(app: App):
+    from nonebot import get_driver
+    from nonebot_plugin_session import Session, SessionLevel
+
+    from nonebot_plugin_access_control.subject.extractor.builtin import session
+    from nonebot_plugin_access_control.subject.extractor import (
+        extract_subjects_from_session,
+    )
+
+    sess = Session(
+        bot_id="12345",
+        bot_type="OneBot V11",
+        platform="qq",
+        level=SessionLevel.LEVEL2,
+        id1="23456",
+        id2="34567",
+    )
+
+    session._cache.clear()
+    session._cache.reset_stats()
+
+    expected = [
+        "qq:g34567:23456",
+        "onebot:g34567:23456",
+        "qq:23456",
+        "onebot:23456",
+        "qq:g34567",
+        "onebot:g34567",
+        "qq:group",
+        "onebot:group",
+        "group",
+        "qq",
+        "onebot",
+        "all",
+    ]
+    assert extract_subjects_from_session(sess) == expected
+    assert extract_subjects_from_session(sess) == expected
+    assert (session._cache.hits, session._cache.misses) == (1, 1)
+
+    # SUPERUSERS变更后重新提取
+    superusers = get_driver().config.superusers
+    superusers.add("23456")
+    try:
+        assert "superuser" in extract_subjects_from_session(sess)
+        assert (session._cache.hits, session._cache.misses) == (1, 2)
+    finally:
+        superusers.discard("23456")
+
+    assert extract_subjects_from_session(sess) == expected